@@ -2,26 +2,96 @@ from flask import Flask
 from dotenv import load_dotenv
 import os
 import secrets
+import time
+
+from app.state_store import get_state_store
+from app.blob_store import BlobStore
+from app.delivery import init_delivery
+from app.usage import UsageTracker, set_usage_tracker
+from app.utils import load_prompt_template
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+
+def load_or_create_secret_key(secret_file: str, attempts: int = 50) -> str:
+    """
+    Return a secret key shared by every worker process.
+
+    The first process to start writes a random key with O_EXCL; all other
+    workers (and later restarts) read the same file, so signed session
+    cookies stay valid whichever worker handles the request.
+    """
+    directory = os.path.dirname(secret_file)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    try:
+        fd = os.open(secret_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker may have created the file but not written it yet
+        for _ in range(attempts):
+            with open(secret_file, 'r', encoding='utf-8') as f:
+                key = f.read().strip()
+            if key:
+                return key
+            time.sleep(0.1)
+        raise RuntimeError(f"Secret key file is empty: {secret_file}")
+
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(key)
+    return key
 
 def create_app():
     # Load environment variables
     load_dotenv()
-    
+
     app = Flask(__name__)
-    
+
+    # Shared data directory (secret key, state database)
+    data_dir = os.environ.get('DATA_DIR', os.path.join(BASE_DIR, 'data'))
+    app.config['DATA_DIR'] = data_dir
+
     # Session configuration
-    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or \
+        load_or_create_secret_key(os.path.join(data_dir, 'secret_key'))
     app.config['SESSION_COOKIE_SECURE'] = False  # Set to True in production with HTTPS
     app.config['SESSION_COOKIE_HTTPONLY'] = True
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
     app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
-    
+
     # Upload configuration
-    app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+    app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, 'uploads')
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-    
+
+    # Cross-process state (invoices, caches) shared by all workers
+    app.config['STATE_DB_PATH'] = os.environ.get('STATE_DB_PATH', os.path.join(data_dir, 'app_state.db'))
+    app.extensions['state_store'] = get_state_store(app.config['STATE_DB_PATH'])
+
+    # Token/cost accounting and budgets, shared by all workers through the state store
+    app.extensions['usage_tracker'] = UsageTracker.from_env(app.extensions['state_store'])
+    set_usage_tracker(app.extensions['usage_tracker'])
+
+    # Content-addressed upload storage with background retention GC
+    app.extensions['blob_store'] = BlobStore(
+        app.config['UPLOAD_FOLDER'],
+        app.extensions['state_store'],
+        retention_seconds=float(os.environ.get('BLOB_RETENTION_DAYS', '30')) * 24 * 3600
+    )
+    app.extensions['blob_store'].start_gc(float(os.environ.get('BLOB_GC_INTERVAL_SECONDS', '3600')))
+
+    # Preload the extraction prompt once per worker instead of on every upload
+    prompt_file = os.path.join(os.path.dirname(__file__), 'prompts', 'invoice_prompt.txt')
+    app.config['INVOICE_PROMPT'] = load_prompt_template(prompt_file)
+
     # Register routes
     from app.routes import main
     app.register_blueprint(main)
-    
+
+    # Fingerprinted/precompressed static assets and JSON compression
+    init_delivery(app)
+
+    # Compile templates up front so the first request on each worker is not slower
+    for template_name in ('index.html', 'chat.html'):
+        app.jinja_env.get_template(template_name)
+
     return app
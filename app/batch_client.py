@@ -0,0 +1,478 @@
+"""
+Offline batch-inference backend for large backfills.
+
+BatchBedrockClient keeps the BedrockClient interface, but extract_invoice_data()
+only queues the request. Queued records are packaged into JSONL files in
+object storage and submitted as Bedrock batch-inference jobs; finished jobs
+are polled and their outputs ingested into the shared invoice store.
+
+The object store and job runner are pluggable, so the whole flow can run
+offline with LocalObjectStore and FakeBatchJobRunner.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.bedrock_client import BedrockClient
+from app.mock_bedrock import get_mock_invoice
+from app.usage import record_usage, usage_scope
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_JOB_STATES = {'Completed', 'PartiallyCompleted', 'Failed', 'Stopped', 'Expired'}
+FAILED_JOB_STATES = {'Failed', 'Stopped', 'Expired'}
+
+def split_s3_uri(uri: str) -> Tuple[str, str]:
+    """Split ``s3://bucket/key`` into (bucket, key)."""
+    if not uri.startswith('s3://'):
+        raise ValueError(f"Not an s3:// URI: {uri}")
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
+
+class S3ObjectStore:
+    def __init__(self, region_name: Optional[str] = None):
+        """Object store backed by Amazon S3."""
+        import boto3
+        self.s3 = boto3.client('s3', region_name=region_name or os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+
+    def put_bytes(self, uri: str, data: bytes) -> None:
+        bucket, key = split_s3_uri(uri)
+        self.s3.put_object(Bucket=bucket, Key=key, Body=data)
+
+    def get_bytes(self, uri: str) -> bytes:
+        bucket, key = split_s3_uri(uri)
+        return self.s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+    def list(self, prefix_uri: str) -> List[str]:
+        bucket, prefix = split_s3_uri(prefix_uri)
+        uris = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                uris.append(f"s3://{bucket}/{obj['Key']}")
+        return uris
+
+class LocalObjectStore:
+    def __init__(self, root: str):
+        """
+        Local stand-in for S3: ``s3://bucket/key`` maps to ``root/bucket/key``.
+
+        Args:
+            root: Directory holding the fake buckets
+        """
+        self.root = root
+
+    def _path(self, uri: str) -> str:
+        bucket, key = split_s3_uri(uri)
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def put_bytes(self, uri: str, data: bytes) -> None:
+        path = self._path(uri)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def get_bytes(self, uri: str) -> bytes:
+        with open(self._path(uri), 'rb') as f:
+            return f.read()
+
+    def list(self, prefix_uri: str) -> List[str]:
+        bucket, prefix = split_s3_uri(prefix_uri)
+        bucket_dir = os.path.join(self.root, bucket)
+        uris = []
+        for dirpath, _, filenames in os.walk(bucket_dir):
+            for filename in filenames:
+                key = os.path.relpath(os.path.join(dirpath, filename), bucket_dir).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    uris.append(f"s3://{bucket}/{key}")
+        return sorted(uris)
+
+class BedrockBatchJobRunner:
+    def __init__(self, role_arn: str, model_id: str, region_name: Optional[str] = None):
+        """
+        Submit and track real Bedrock model-invocation (batch) jobs.
+
+        Args:
+            role_arn: IAM role Bedrock assumes to read input and write output
+            model_id: Model or inference profile used for the job
+            region_name: AWS region of the Bedrock control plane
+        """
+        import boto3
+        self.bedrock = boto3.client('bedrock', region_name=region_name or os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+        self.role_arn = role_arn
+        self.model_id = model_id
+
+    def submit(self, job_name: str, input_uri: str, output_uri: str) -> str:
+        response = self.bedrock.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self.role_arn,
+            modelId=self.model_id,
+            inputDataConfig={'s3InputDataConfig': {'s3Uri': input_uri}},
+            outputDataConfig={'s3OutputDataConfig': {'s3Uri': output_uri}}
+        )
+        return response['jobArn']
+
+    def status(self, job_id: str) -> str:
+        return self.bedrock.get_model_invocation_job(jobIdentifier=job_id)['status']
+
+def mock_model_output(model_input: Dict[str, Any]) -> Dict[str, Any]:
+    """Default FakeBatchJobRunner responder: the mock invoice as a Bedrock response body."""
+    invoice = get_mock_invoice()
+    for key in ('extraction_successful', 'extraction_method', 'confidence_score'):
+        invoice.pop(key, None)
+    return {
+        'content': [{'type': 'text', 'text': json.dumps(invoice)}],
+        'stop_reason': 'end_turn',
+        'usage': {'input_tokens': 1500, 'output_tokens': 600}
+    }
+
+class FakeBatchJobRunner:
+    def __init__(self, object_store, responder: Callable[[Dict[str, Any]], Dict[str, Any]] = mock_model_output,
+                 polls_until_complete: int = 1):
+        """
+        Offline job runner that writes Bedrock-shaped output files.
+
+        Args:
+            object_store: Store the input and output files live in
+            responder: Maps a modelInput to a modelOutput response body
+            polls_until_complete: Number of status() calls reporting InProgress first
+        """
+        self.object_store = object_store
+        self.responder = responder
+        self.polls_until_complete = polls_until_complete
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, job_name: str, input_uri: str, output_uri: str) -> str:
+        job_id = f"fake-{uuid.uuid4().hex[:12]}"
+        self._jobs[job_id] = {'input_uri': input_uri, 'output_uri': output_uri, 'polls': 0}
+        return job_id
+
+    def status(self, job_id: str) -> str:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return 'Failed'
+        job['polls'] += 1
+        if job['polls'] <= self.polls_until_complete:
+            return 'InProgress'
+        if not job.get('written'):
+            # Same layout as Bedrock: <output_uri>/<job id>/<input file name>.out
+            lines = []
+            for line in self.object_store.get_bytes(job['input_uri']).decode('utf-8').splitlines():
+                record = json.loads(line)
+                record['modelOutput'] = self.responder(record['modelInput'])
+                lines.append(json.dumps(record))
+            input_name = job['input_uri'].rsplit('/', 1)[-1]
+            output = f"{job['output_uri'].rstrip('/')}/{job_id}/{input_name}.out"
+            self.object_store.put_bytes(output, ('\n'.join(lines) + '\n').encode('utf-8'))
+            job['written'] = True
+        return 'Completed'
+
+class BatchBedrockClient(BedrockClient):
+    # Results arrive later as whole invoices: extract_invoice() must make exactly one
+    # full-image call per invoice (no OCR text path, no tiles to stitch)
+    deferred = True
+
+    def __init__(self, object_store, job_runner, state_store, bucket_uri: str, spool_dir: str,
+                 min_records_per_job: int = 100, max_records_per_job: int = 10000,
+                 max_bytes_per_job: int = 1024 ** 3, max_job_attempts: int = 3):
+        """
+        Initialize the batch backend.
+
+        Does not call BedrockClient.__init__: no runtime client is needed,
+        only the request-building and response-parsing helpers. Methods that
+        would need a synchronous runtime call are overridden.
+
+        Args:
+            object_store: S3ObjectStore or LocalObjectStore
+            job_runner: BedrockBatchJobRunner or FakeBatchJobRunner
+            state_store: Shared StateStore for job state and results
+            bucket_uri: ``s3://bucket/prefix`` under which job files are written
+            spool_dir: Local directory for queued records
+            min_records_per_job: Smallest job submitted without force (Bedrock's minimum is 100)
+            max_records_per_job: Largest job submitted
+            max_bytes_per_job: Largest job input file, in bytes (records carry their image inline)
+            max_job_attempts: Jobs a record may be part of before it is marked failed
+        """
+        self.object_store = object_store
+        self.job_runner = job_runner
+        self.state_store = state_store
+        self.bucket_uri = bucket_uri.rstrip('/')
+        self.min_records_per_job = min_records_per_job
+        self.max_records_per_job = max_records_per_job
+        self.max_bytes_per_job = max_bytes_per_job
+        self.max_job_attempts = max_job_attempts
+        self.pending_dir = os.path.join(spool_dir, 'pending')
+        self.claimed_dir = os.path.join(spool_dir, 'claimed')
+        os.makedirs(self.pending_dir, exist_ok=True)
+        os.makedirs(self.claimed_dir, exist_ok=True)
+        logger.info(f"📦 Batch Bedrock client initialized (output: {self.bucket_uri})")
+
+    def extract_invoice_data(self, image_path: str, prompt: str) -> Dict[str, Any]:
+        """
+        Queue an extraction for the next batch job.
+
+        Args:
+            image_path: Path to the invoice image
+            prompt: Extraction prompt for Claude
+
+        Returns:
+            Placeholder with the record id; the result is ingested later
+        """
+        try:
+            record_id = uuid.uuid4().hex[:11].upper()
+            record = {
+                'recordId': record_id,
+                'modelInput': self.build_extraction_body(image_path, prompt)
+            }
+            # One file per record, renamed into place, so concurrent producers never interleave
+            tmp_path = os.path.join(self.pending_dir, f".{record_id}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            os.replace(tmp_path, os.path.join(self.pending_dir, f"{record_id}.json"))
+            self.state_store.set('batch_record', record_id, {'source': image_path, 'status': 'queued'})
+
+            logger.info(f"📥 Queued {image_path} for batch extraction as {record_id}")
+            return {
+                'extraction_successful': False,
+                'batch_status': 'queued',
+                'record_id': record_id,
+                'extracted_by': 'AWS Bedrock batch inference (queued)'
+            }
+        except Exception as e:
+            logger.error(f"❌ Error queueing invoice for batch extraction: {str(e)}")
+            return {
+                "error": str(e),
+                "extraction_successful": False,
+                "extracted_by": 'AWS Bedrock batch inference (Failed)'
+            }
+
+    def extract_invoice_from_text(self, ocr_text: str, prompt: str) -> Dict[str, Any]:
+        """The OCR text path is not used on the batch backend; invoices are queued as images."""
+        return {
+            "error": "OCR text extraction is not available on the batch extraction backend",
+            "extraction_successful": False,
+            "extracted_by": 'AWS Bedrock batch inference (Unavailable)'
+        }
+
+    def extract_fields(self, image_path: str, fields: List[str]) -> Dict[str, Any]:
+        """Field re-extraction needs an immediate answer, which the batch backend cannot give."""
+        return {
+            "error": "Field re-extraction is not available on the batch extraction backend",
+            "extraction_successful": False,
+            "extracted_by": 'AWS Bedrock batch inference (Unavailable)'
+        }
+
+    def chat_with_claude(self, question: str, context: str) -> str:
+        """Interactive chat is not available on the batch backend."""
+        return "Sorry, chat is not available while using the batch extraction backend."
+
+    def pending_count(self) -> int:
+        """Number of records waiting for a job."""
+        return sum(1 for name in os.listdir(self.pending_dir) if name.endswith('.json'))
+
+    def submit_pending(self, force: bool = False) -> List[str]:
+        """
+        Package queued records into JSONL files and submit batch jobs.
+
+        Args:
+            force: Submit even if fewer than min_records_per_job are queued
+
+        Returns:
+            Ids of the submitted jobs
+        """
+        names = sorted(name for name in os.listdir(self.pending_dir) if name.endswith('.json'))
+        job_ids = []
+        while names and (force or len(names) >= self.min_records_per_job):
+            chunk, names = self._next_chunk(names)
+            job_name = f"invoice-batch-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            job_claim_dir = os.path.join(self.claimed_dir, job_name)
+            os.makedirs(job_claim_dir)
+
+            lines = []
+            record_ids = []
+            for name in chunk:
+                claimed = os.path.join(job_claim_dir, name)
+                try:
+                    # Atomic claim: another submitter that got here first wins
+                    os.rename(os.path.join(self.pending_dir, name), claimed)
+                except FileNotFoundError:
+                    continue
+                with open(claimed, 'r', encoding='utf-8') as f:
+                    lines.append(f.read().strip())
+                record_ids.append(name[:-len('.json')])
+            if not lines:
+                os.rmdir(job_claim_dir)
+                continue
+
+            input_uri = f"{self.bucket_uri}/input/{job_name}.jsonl"
+            output_uri = f"{self.bucket_uri}/output/{job_name}/"
+            try:
+                self.object_store.put_bytes(input_uri, ('\n'.join(lines) + '\n').encode('utf-8'))
+                job_id = self.job_runner.submit(job_name, input_uri, output_uri)
+            except Exception:
+                # Hand the records back so the next submit picks them up again
+                self._release_claim(job_claim_dir)
+                logger.error(f"❌ Submitting batch job {job_name} failed, {len(record_ids)} records returned to the queue")
+                raise
+
+            self.state_store.set('batch_job', job_id, {
+                'job_name': job_name,
+                'status': 'Submitted',
+                'input_uri': input_uri,
+                'output_uri': output_uri,
+                'record_count': len(record_ids),
+                'submitted_at': time.time()
+            })
+            for record_id in record_ids:
+                record = self.state_store.get('batch_record', record_id, {})
+                record.update({'status': 'submitted', 'job_id': job_id})
+                self.state_store.set('batch_record', record_id, record)
+
+            logger.info(f"🚀 Submitted batch job {job_name} with {len(record_ids)} records")
+            job_ids.append(job_id)
+        return job_ids
+
+    def _next_chunk(self, names: List[str]) -> Tuple[List[str], List[str]]:
+        """Split off the next job's records, capped by record count and input-file bytes."""
+        size = 0
+        for count, name in enumerate(names[:self.max_records_per_job]):
+            try:
+                size += os.path.getsize(os.path.join(self.pending_dir, name)) + 1
+            except FileNotFoundError:
+                continue  # Claimed by another submitter
+            # A single oversized record still gets a job of its own
+            if size > self.max_bytes_per_job and count > 0:
+                return names[:count], names[count:]
+        count = min(len(names), self.max_records_per_job)
+        return names[:count], names[count:]
+
+    def _release_claim(self, job_claim_dir: str) -> None:
+        """Move claimed records back to pending."""
+        for name in os.listdir(job_claim_dir):
+            os.replace(os.path.join(job_claim_dir, name), os.path.join(self.pending_dir, name))
+        os.rmdir(job_claim_dir)
+
+    def poll_jobs(self) -> Dict[str, str]:
+        """
+        Refresh the state of unfinished jobs and ingest completed ones.
+
+        Returns:
+            Mapping of job id to its current status
+        """
+        statuses = {}
+        for job_id, job in self.state_store.items('batch_job').items():
+            if job['status'] in TERMINAL_JOB_STATES:
+                continue
+            status = self.job_runner.status(job_id)
+            if status in ('Completed', 'PartiallyCompleted'):
+                job['ingested'] = self._ingest(job_id, job)
+            elif status in FAILED_JOB_STATES:
+                job['requeued'] = self._requeue(job, status)
+            job['status'] = status
+            self.state_store.set('batch_job', job_id, job)
+            statuses[job_id] = status
+            logger.info(f"📊 Batch job {job['job_name']}: {status}")
+        return statuses
+
+    def _ingest(self, job_id: str, job: Dict[str, Any]) -> int:
+        """Parse a finished job's output files into the invoice store."""
+        ingested = 0
+        for uri in self.object_store.list(job['output_uri']):
+            if not uri.endswith('.jsonl.out'):
+                continue  # Skip manifest files
+            for line in self.object_store.get_bytes(uri).decode('utf-8').splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                record_id = record.get('recordId')
+                meta = self.state_store.get('batch_record', record_id, {})
+                if 'modelOutput' in record:
+                    with usage_scope(invoice_id=record_id):
+                        record_usage('batch_extraction', record['modelOutput'].get('usage'))
+                    data = self.parse_extraction_response(record['modelOutput'], 'AWS Bedrock batch inference')
+                else:
+                    data = {
+                        'error': json.dumps(record.get('error')),
+                        'extraction_successful': False,
+                        'extracted_by': 'AWS Bedrock batch inference (Failed)'
+                    }
+                data['source_file'] = meta.get('source')
+                self.state_store.set('invoice', record_id, data)
+                meta.update({'status': 'completed' if data.get('extraction_successful') else 'failed'})
+                self.state_store.set('batch_record', record_id, meta)
+                ingested += 1
+
+        claim_dir = os.path.join(self.claimed_dir, job['job_name'])
+        if os.path.isdir(claim_dir):
+            for name in os.listdir(claim_dir):
+                os.remove(os.path.join(claim_dir, name))
+            os.rmdir(claim_dir)
+        logger.info(f"✅ Ingested {ingested} results from batch job {job['job_name']}")
+        return ingested
+
+    def _requeue(self, job: Dict[str, Any], status: str) -> int:
+        """
+        Return a failed job's records to the queue, or fail them after max_job_attempts.
+
+        Args:
+            job: Stored job state
+            status: Terminal job status ('Failed', 'Stopped' or 'Expired')
+
+        Returns:
+            Number of records put back in the queue
+        """
+        claim_dir = os.path.join(self.claimed_dir, job['job_name'])
+        if not os.path.isdir(claim_dir):
+            return 0
+
+        requeued = 0
+        for name in os.listdir(claim_dir):
+            record_id = name[:-len('.json')]
+            meta = self.state_store.get('batch_record', record_id, {})
+            meta['attempts'] = meta.get('attempts', 0) + 1
+            meta.pop('job_id', None)
+            if meta['attempts'] < self.max_job_attempts:
+                os.replace(os.path.join(claim_dir, name), os.path.join(self.pending_dir, name))
+                meta['status'] = 'queued'
+                requeued += 1
+            else:
+                os.remove(os.path.join(claim_dir, name))
+                meta['status'] = 'failed'
+                self.state_store.set('invoice', record_id, {
+                    'error': f"Batch job {job['job_name']} ended {status} ({meta['attempts']} attempts)",
+                    'extraction_successful': False,
+                    'extracted_by': 'AWS Bedrock batch inference (Failed)',
+                    'source_file': meta.get('source')
+                })
+            self.state_store.set('batch_record', record_id, meta)
+        os.rmdir(claim_dir)
+
+        logger.warning(f"⚠️ Batch job {job['job_name']} ended {status}: {requeued} records requeued")
+        return requeued
+
+    def run_until_complete(self, poll_interval: float = 60.0) -> Dict[str, str]:
+        """
+        Submit everything queued and poll until all jobs reach a terminal state.
+
+        Records of failed jobs are requeued and resubmitted until they
+        succeed or run out of attempts.
+
+        Args:
+            poll_interval: Seconds between status checks
+
+        Returns:
+            Final status of every job polled
+        """
+        self.submit_pending(force=True)
+        final = {}
+        while True:
+            statuses = self.poll_jobs()
+            final.update(statuses)
+            if self.pending_count():
+                self.submit_pending(force=True)
+            elif all(status in TERMINAL_JOB_STATES for status in statuses.values()):
+                return final
+            time.sleep(poll_interval)
@@ -1,17 +1,40 @@
-import boto3
 import json
 import base64
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import os
+import time
+
+from app.client_pool import ClientPool
+from app.recording import FixtureRecorder
+from app.usage import record_usage
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+EXTRACTION_SYSTEM_PROMPT = "You are a professional invoice data extraction assistant. Always respond with valid JSON format."
+
+def build_fields_prompt(fields: List[str]) -> str:
+    """Prompt asking only for the given fields of a cropped invoice region."""
+    return (
+        "This image is a cropped region of an invoice. Extract only these fields: "
+        f"{', '.join(fields)}.\n\n"
+        "Respond with a JSON object containing exactly those keys (use null if a value is not visible), "
+        "using the same data types as a full invoice extraction, plus a \"field_confidence\" object mapping "
+        "each key to {\"confidence\": 0.0-1.0, \"bbox\": [x0, y0, x1, y1]} where bbox is given as "
+        "fractions of this image's width and height.\n\n"
+        "Please provide only the JSON response without any additional text or formatting."
+    )
+
 class BedrockClient:
-    def __init__(self):
-        """Initialize the Bedrock client with AWS credentials."""
+    def __init__(self, stats_store=None):
+        """
+        Initialize the Bedrock client with AWS credentials.
+        
+        Args:
+            stats_store: Optional StateStore for client-pool metrics shared across workers
+        """
         try:
             # Check for required environment variables
             aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
@@ -20,17 +43,24 @@ class BedrockClient:
             if not aws_access_key or not aws_secret_key:
                 raise ValueError("AWS credentials not found in environment variables")
             
-            self.bedrock_runtime = boto3.client(
-                'bedrock-runtime',
-                aws_access_key_id=aws_access_key,
-                aws_secret_access_key=aws_secret_key,
-                region_name=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
-            )
             self.model_id = "arn:aws:bedrock:us-east-2:905418105552:inference-profile/us.anthropic.claude-3-5-sonnet-20240620-v1:0"
             
+            # One endpoint per configured region/profile (BEDROCK_ENDPOINTS), with hedging and failover
+            self.pool = ClientPool.from_env(
+                aws_access_key,
+                aws_secret_key,
+                default_region=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+                default_model_id=self.model_id,
+                stats_store=stats_store
+            )
+            
+            # Optional: capture request/response pairs and timings for replay
+            record_path = os.environ.get('BEDROCK_RECORD_PATH')
+            self.recorder = FixtureRecorder(record_path) if record_path else None
+            
             # Test the connection
             logger.info("🔐 AWS Bedrock client initialized with credentials")
-            logger.info(f"🌍 Region: {os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')}")
+            logger.info(f"🌍 Regions: {', '.join(endpoint.name for endpoint in self.pool.endpoints)}")
             logger.info(f"🤖 Model: Claude 3.5 Sonnet")
             
         except Exception as e:
@@ -46,6 +76,72 @@ class BedrockClient:
             logger.error(f"Error encoding image to base64: {str(e)}")
             raise
     
+    def build_image_block(self, image_path: str) -> Dict[str, Any]:
+        """
+        Build the base64 image content block for a Bedrock message.
+        
+        Args:
+            image_path: Path to the image
+            
+        Returns:
+            Anthropic image content block
+        """
+        # Encode image to base64
+        logger.info(f"📸 Encoding image: {image_path}")
+        image_base64 = self.encode_image_to_base64(image_path)
+        logger.info(f"✅ Image encoded successfully (size: {len(image_base64)} characters)")
+        
+        # Determine image format
+        image_format = "image/jpeg"
+        if image_path.lower().endswith('.png'):
+            image_format = "image/png"
+        elif image_path.lower().endswith('.gif'):
+            image_format = "image/gif"
+        elif image_path.lower().endswith('.webp'):
+            image_format = "image/webp"
+        
+        logger.info(f"🎨 Image format detected: {image_format}")
+        
+        return {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": image_format,
+                "data": image_base64
+            }
+        }
+    
+    def build_extraction_body(self, image_path: str, prompt: str, max_tokens: int = 4000) -> Dict[str, Any]:
+        """
+        Build the request body for an image extraction call.
+        
+        Args:
+            image_path: Path to the invoice image
+            prompt: Extraction prompt for Claude
+            max_tokens: Output token budget
+            
+        Returns:
+            Anthropic messages request body
+        """
+        message = {
+            "role": "user",
+            "content": [
+                self.build_image_block(image_path),
+                {
+                    "type": "text",
+                    "text": prompt
+                }
+            ]
+        }
+        
+        return {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens,
+            "messages": [message],
+            "temperature": 0.1,
+            "system": EXTRACTION_SYSTEM_PROMPT
+        }
+    
     def extract_invoice_data(self, image_path: str, prompt: str) -> Dict[str, Any]:
         """
         Extract structured data from invoice image using Claude 3.5 Vision.
@@ -58,92 +154,158 @@ class BedrockClient:
             Dictionary containing extracted invoice data
         """
         try:
-            # Encode image to base64
-            logger.info(f"📸 Encoding image: {image_path}")
-            image_base64 = self.encode_image_to_base64(image_path)
-            logger.info(f"✅ Image encoded successfully (size: {len(image_base64)} characters)")
-            
-            # Determine image format
-            image_format = "image/jpeg"
-            if image_path.lower().endswith('.png'):
-                image_format = "image/png"
-            elif image_path.lower().endswith('.gif'):
-                image_format = "image/gif"
-            elif image_path.lower().endswith('.webp'):
-                image_format = "image/webp"
-            
-            logger.info(f"🎨 Image format detected: {image_format}")
-            
-            # Prepare the request payload
-            message = {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": image_format,
-                            "data": image_base64
-                        }
-                    },
-                    {
-                        "type": "text",
-                        "text": prompt
-                    }
-                ]
+            body = self.build_extraction_body(image_path, prompt)
+            
+            logger.info(f"🚀 Calling AWS Bedrock Claude 3.5 Vision...")
+            logger.info(f"📋 Prompt length: {len(prompt)} characters")
+            
+            response_body = self.invoke_model(body, kind='extraction')
+            return self.parse_extraction_response(response_body, 'AWS Bedrock Claude 3.5 Vision')
+                
+        except Exception as e:
+            logger.error(f"❌ Error extracting invoice data: {str(e)}")
+            logger.error(f"🔍 Error type: {type(e).__name__}")
+            return {
+                "error": str(e),
+                "extraction_successful": False,
+                "extracted_by": 'AWS Bedrock Claude 3.5 Vision (Failed)'
             }
+    
+    def extract_invoice_from_text(self, ocr_text: str, prompt: str) -> Dict[str, Any]:
+        """
+        Extract structured data from OCR text instead of the image.
+        
+        Args:
+            ocr_text: Layout-preserving OCR text of the invoice
+            prompt: Extraction prompt for Claude
             
+        Returns:
+            Dictionary containing extracted invoice data
+        """
+        try:
+            text_prompt = (
+                "The invoice image has been converted to text by OCR. Each line is in reading order "
+                "and column positions are preserved with spaces.\n\n"
+                f"OCR TEXT:\n{ocr_text}\n\n{prompt}"
+            )
             body = {
                 "anthropic_version": "bedrock-2023-05-31",
                 "max_tokens": 4000,
-                "messages": [message],
+                "messages": [{"role": "user", "content": text_prompt}],
                 "temperature": 0.1,
-                "system": "You are a professional invoice data extraction assistant. Always respond with valid JSON format."
+                "system": EXTRACTION_SYSTEM_PROMPT
             }
             
-            logger.info(f"🚀 Calling AWS Bedrock Claude 3.5 Vision...")
-            logger.info(f"📋 Prompt length: {len(prompt)} characters")
+            logger.info(f"🚀 Calling AWS Bedrock Claude 3.5 with OCR text ({len(ocr_text)} characters)...")
+            
+            response_body = self.invoke_model(body, kind='text_extraction')
+            return self.parse_extraction_response(response_body, 'AWS Bedrock Claude 3.5 (OCR text)')
+            
+        except Exception as e:
+            logger.error(f"❌ Error extracting invoice data from text: {str(e)}")
+            return {
+                "error": str(e),
+                "extraction_successful": False,
+                "extracted_by": 'AWS Bedrock Claude 3.5 (OCR text, Failed)'
+            }
+    
+    def extract_fields(self, image_path: str, fields: List[str]) -> Dict[str, Any]:
+        """
+        Re-extract a few fields from a (usually cropped) region of an invoice.
+        
+        Args:
+            image_path: Path to the image region
+            fields: Top-level field names to extract
             
-            # Make the API call
-            response = self.bedrock_runtime.invoke_model(
-                modelId=self.model_id,
-                body=json.dumps(body),
-                contentType='application/json'
+        Returns:
+            Dictionary with the requested fields and their field_confidence
+        """
+        try:
+            body = self.build_extraction_body(
+                image_path,
+                build_fields_prompt(fields),
+                max_tokens=min(1000, 150 * len(fields) + 200)
             )
             
-            # Parse response
-            response_body = json.loads(response['body'].read())
-            extracted_text = response_body['content'][0]['text']
-            
-            logger.info("✅ Successfully received response from Claude")
-            logger.info(f"📄 Response length: {len(extracted_text)} characters")
-            
-            # Try to parse as JSON, if it fails return as text
-            try:
-                parsed_data = json.loads(extracted_text)
-                logger.info("✅ Successfully parsed JSON response")
-                parsed_data['extraction_successful'] = True
-                parsed_data['extracted_by'] = 'AWS Bedrock Claude 3.5 Vision'
-                return parsed_data
-            except json.JSONDecodeError as json_error:
-                logger.warning(f"⚠️ Response was not valid JSON: {str(json_error)}")
-                logger.info(f"📝 Raw response: {extracted_text[:200]}...")
-                # If Claude returns non-JSON text, wrap it in a structure
-                return {
-                    "raw_extraction": extracted_text,
-                    "extraction_successful": False,
-                    "error": "Response was not in valid JSON format",
-                    "json_error": str(json_error),
-                    "extracted_by": 'AWS Bedrock Claude 3.5 Vision'
-                }
-                
+            logger.info(f"🎯 Re-extracting fields {fields} from: {image_path}")
+            
+            response_body = self.invoke_model(body, kind='field_extraction')
+            return self.parse_extraction_response(response_body, 'AWS Bedrock Claude 3.5 Vision (field re-extraction)')
+            
         except Exception as e:
-            logger.error(f"❌ Error extracting invoice data: {str(e)}")
-            logger.error(f"🔍 Error type: {type(e).__name__}")
+            logger.error(f"❌ Error re-extracting fields: {str(e)}")
             return {
                 "error": str(e),
                 "extraction_successful": False,
-                "extracted_by": 'AWS Bedrock Claude 3.5 Vision (Failed)'
+                "extracted_by": 'AWS Bedrock Claude 3.5 Vision (field re-extraction, Failed)'
+            }
+    
+    def invoke_model(self, body: Dict[str, Any], kind: str = 'extraction') -> Dict[str, Any]:
+        """
+        Send a request body to Bedrock and return the decoded response body.
+        
+        Records the call's token usage and, in record mode, the fixture entry.
+        
+        Args:
+            body: Anthropic messages request body
+            kind: Call type, used for usage accounting and fixtures
+            
+        Returns:
+            Parsed response body (content, usage, stop_reason)
+        """
+        started = time.time()
+        response_body = self._invoke(body, kind)
+        if self.recorder is not None:
+            self.recorder.record(kind, body, response_body, time.time() - started)
+        record_usage(kind, response_body.get('usage'))
+        return response_body
+    
+    def _invoke(self, body: Dict[str, Any], kind: str) -> Dict[str, Any]:
+        """Make the raw Bedrock runtime call through the regional client pool."""
+        return self.pool.invoke(body, kind)
+    
+    def parse_extraction_response(self, response_body: Dict[str, Any], extracted_by: str) -> Dict[str, Any]:
+        """
+        Turn a Bedrock response body into the invoice data dictionary.
+        
+        Args:
+            response_body: Decoded Bedrock response body
+            extracted_by: Label recorded in the result
+            
+        Returns:
+            Parsed invoice data, or a failure structure holding the raw text
+        """
+        extracted_text = response_body['content'][0]['text']
+        usage = response_body.get('usage', {})
+        token_usage = {
+            'input_tokens': usage.get('input_tokens', 0),
+            'output_tokens': usage.get('output_tokens', 0)
+        }
+        
+        logger.info("✅ Successfully received response from Claude")
+        logger.info(f"📄 Response length: {len(extracted_text)} characters")
+        
+        # Try to parse as JSON, if it fails return as text
+        try:
+            parsed_data = json.loads(extracted_text)
+            logger.info("✅ Successfully parsed JSON response")
+            parsed_data['extraction_successful'] = True
+            parsed_data['extracted_by'] = extracted_by
+            parsed_data['token_usage'] = token_usage
+            return parsed_data
+        except json.JSONDecodeError as json_error:
+            logger.warning(f"⚠️ Response was not valid JSON: {str(json_error)}")
+            logger.info(f"📝 Raw response: {extracted_text[:200]}...")
+            # If Claude returns non-JSON text, wrap it in a structure
+            return {
+                "raw_extraction": extracted_text,
+                "extraction_successful": False,
+                "error": "Response was not in valid JSON format",
+                "json_error": str(json_error),
+                # Output cut off by max_tokens (e.g. hundreds of line items)
+                "truncated": response_body.get('stop_reason') == 'max_tokens',
+                "extracted_by": extracted_by,
+                "token_usage": token_usage
             }
     
     def chat_with_claude(self, question: str, context: str) -> str:
@@ -184,13 +346,7 @@ class BedrockClient:
             
             logger.info("Sending chat request to Claude...")
             
-            response = self.bedrock_runtime.invoke_model(
-                modelId=self.model_id,
-                body=json.dumps(body),
-                contentType='application/json'
-            )
-            
-            response_body = json.loads(response['body'].read())
+            response_body = self.invoke_model(body, kind='chat')
             return response_body['content'][0]['text']
             
         except Exception as e:
@@ -0,0 +1,263 @@
+"""
+Content-addressed storage for uploaded invoice images.
+
+Blobs are named by the SHA-256 of their content and sharded two levels deep
+(``ab/cd/abcd....png``), so identical uploads are stored once and no single
+directory grows with invoice volume. Retention is tracked in the shared state
+store with an expiry per blob; garbage collection walks that index instead of
+scanning the filesystem.
+"""
+import os
+import re
+import time
+import hashlib
+import tempfile
+import threading
+import logging
+from typing import Any, Dict, Optional
+
+from werkzeug.utils import secure_filename
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; previews fall back to the original image
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+BLOB_NAME_PATTERN = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]{1,5}$')
+THUMBNAIL_SUFFIX = '.thumb.jpg'
+TOMBSTONE_SUFFIX = '.deleting'
+CHUNK_SIZE = 64 * 1024
+
+# Extension is derived from the content, so identical bytes always get the same name
+MAGIC_EXTENSIONS = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+EXTENSION_ALIASES = {'jpeg': 'jpg', 'jpe': 'jpg', 'jfif': 'jpg'}
+
+def detect_extension(head: bytes, filename: str) -> str:
+    """Blob extension from the file's magic bytes, falling back to its normalized name."""
+    for magic, ext in MAGIC_EXTENSIONS:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    ext = os.path.splitext(filename)[1].lower().lstrip('.') or 'bin'
+    return EXTENSION_ALIASES.get(ext, ext)
+
+class BlobStore:
+    def __init__(self, root: str, state_store, retention_seconds: float = 30 * 24 * 3600,
+                 thumbnail_size: int = 800):
+        """
+        Initialize the blob store.
+
+        Args:
+            root: Directory holding the sharded blobs
+            state_store: Shared StateStore used as the retention index
+            retention_seconds: How long a blob is kept after its last upload
+            thumbnail_size: Longest side in pixels of generated previews
+        """
+        self.root = root
+        self.state_store = state_store
+        self.retention_seconds = retention_seconds
+        self.thumbnail_size = thumbnail_size
+        self._tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._gc_thread = None
+        self._gc_pid = None
+
+    def _shard_dir(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4])
+
+    def path_for(self, name: str) -> Optional[str]:
+        """
+        Resolve a blob name to its path on disk.
+
+        Args:
+            name: Blob name as returned by put() (``<sha256>.<ext>``)
+
+        Returns:
+            Path to the blob, or None if the name is invalid or the blob is gone
+        """
+        if not BLOB_NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self._shard_dir(name[:64]), name)
+        return path if os.path.exists(path) else None
+
+    def thumbnail_path_for(self, name: str) -> Optional[str]:
+        """Return the path of a blob's preview thumbnail, if one was generated."""
+        if not BLOB_NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self._shard_dir(name[:64]), name[:64] + THUMBNAIL_SUFFIX)
+        return path if os.path.exists(path) else None
+
+    def put(self, file) -> Dict[str, Any]:
+        """
+        Store an uploaded file, deduplicating identical content.
+
+        The upload is streamed to a temporary file while hashing, then moved
+        into place with an atomic rename, so concurrent uploads never collide.
+
+        Args:
+            file: Flask/werkzeug FileStorage object
+
+        Returns:
+            Dictionary with the blob name, path, size, original filename and
+            whether the content was already stored
+        """
+        original_filename = secure_filename(file.filename or '') or 'upload'
+
+        hasher = hashlib.sha256()
+        size = 0
+        head = b''
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = file.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if not head:
+                        head = chunk[:16]
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+
+            digest = hasher.hexdigest()
+            name = f"{digest}.{detect_extension(head, original_filename)}"
+            shard_dir = self._shard_dir(digest)
+            path = os.path.join(shard_dir, name)
+
+            # (Re)start the retention clock before looking for the file, so GC
+            # sees the blob as live and leaves an existing copy alone
+            self.state_store.set('blob', name, {'size': size}, ttl=self.retention_seconds)
+
+            os.makedirs(shard_dir, exist_ok=True)
+            while True:
+                try:
+                    # Atomic create-if-absent: only the upload that actually places the file counts it
+                    os.link(tmp_path, path)
+                    deduplicated = False
+                    break
+                except FileExistsError:
+                    # GC may tombstone the existing copy between the link and this check
+                    if os.path.exists(path):
+                        deduplicated = True
+                        break
+            os.remove(tmp_path)
+            if not deduplicated:
+                self.state_store.increment_many('blob_stats', {'bytes': size, 'count': 1})
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if not deduplicated:
+            self._make_thumbnail(path, digest)
+
+        logger.info(f"Stored blob {name} ({size} bytes, deduplicated={deduplicated})")
+        return {
+            'name': name,
+            'path': path,
+            'size': size,
+            'original_filename': original_filename,
+            'deduplicated': deduplicated
+        }
+
+    def _make_thumbnail(self, path: str, digest: str) -> Optional[str]:
+        """Write a small JPEG preview next to the blob when Pillow is available."""
+        if Image is None:
+            return None
+        thumb_path = os.path.join(self._shard_dir(digest), digest + THUMBNAIL_SUFFIX)
+        try:
+            with Image.open(path) as img:
+                img.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                if img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                img.save(thumb_path, 'JPEG', quality=80, optimize=True)
+            return thumb_path
+        except Exception as e:
+            logger.warning(f"Could not generate thumbnail for {path}: {str(e)}")
+            return None
+
+    def collect_garbage(self, batch_size: int = 500) -> int:
+        """
+        Delete blobs whose retention period has expired.
+
+        Each blob is first renamed to a tombstone and its row re-checked, so an
+        upload that refreshes the row mid-collection keeps its file.
+
+        Args:
+            batch_size: Number of expired blobs handled per index query
+
+        Returns:
+            Number of blobs deleted
+        """
+        deleted = 0
+        while True:
+            expired = self.state_store.pop_expired('blob', limit=batch_size)
+            if not expired:
+                break
+            for name, meta in expired.items():
+                if self.state_store.get('blob', name) is not None:
+                    continue  # Re-uploaded since it was popped
+                digest = name[:64]
+                path = os.path.join(self._shard_dir(digest), name)
+                tombstone = path + TOMBSTONE_SUFFIX
+                try:
+                    os.rename(path, tombstone)
+                except FileNotFoundError:
+                    continue  # Never placed (failed upload) or already removed
+
+                if self.state_store.get('blob', name) is not None:
+                    # Re-uploaded while tombstoned: put the file back unless the
+                    # upload already re-placed (and re-counted) it
+                    try:
+                        os.link(tombstone, path)
+                        os.remove(tombstone)
+                        continue
+                    except FileExistsError:
+                        pass
+
+                os.remove(tombstone)
+                if not os.path.exists(path):
+                    try:
+                        os.remove(os.path.join(self._shard_dir(digest), digest + THUMBNAIL_SUFFIX))
+                    except FileNotFoundError:
+                        pass
+                self.state_store.increment_many('blob_stats', {'bytes': -meta.get('size', 0), 'count': -1})
+                deleted += 1
+            if len(expired) < batch_size:
+                break
+        if deleted:
+            logger.info(f"Blob GC removed {deleted} expired blobs")
+        return deleted
+
+    def start_gc(self, interval_seconds: float = 3600) -> None:
+        """Start the background retention GC thread for this process."""
+        if self._gc_thread is not None and self._gc_pid == os.getpid():
+            return
+
+        def run():
+            while True:
+                try:
+                    self.collect_garbage()
+                except Exception as e:
+                    logger.error(f"Blob GC failed: {str(e)}")
+                time.sleep(interval_seconds)
+
+        self._gc_thread = threading.Thread(target=run, name='blob-gc', daemon=True)
+        self._gc_pid = os.getpid()
+        self._gc_thread.start()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of stored blobs and their total size."""
+        return {
+            'count': int(self.state_store.get('blob_stats', 'count', 0)),
+            'bytes': int(self.state_store.get('blob_stats', 'bytes', 0))
+        }
@@ -0,0 +1,382 @@
+"""
+Multi-region Bedrock client pool with health tracking, hedging and failover.
+
+Each configured region/inference profile is an endpoint. Calls go to the
+first healthy endpoint; if it has not answered by the observed p95 latency a
+hedge is sent to the next endpoint and whichever answers first wins. Failed
+calls fail over to the next endpoint, and endpoints that keep failing are
+skipped until a cooldown has passed. The pool only replaces the raw
+invoke_model call, so it can be driven by real boto3 clients or by
+FakeEndpoint invokers with injected latency and failures.
+"""
+import os
+import json
+import time
+import random
+import threading
+import contextvars
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from app.usage import record_usage
+
+logger = logging.getLogger(__name__)
+
+POOL_STATS_NAMESPACE = 'bedrock_pool'
+
+# Errors that would fail the same way in every region: never fail over on them
+NON_RETRYABLE_ERRORS = {'ValidationException', 'AccessDeniedException', 'ResourceNotFoundException'}
+
+def pool_settings() -> Dict[str, Any]:
+    """Read hedging and health settings from the environment."""
+    return {
+        'hedging': os.environ.get('BEDROCK_HEDGING', 'true').lower() in ('1', 'true', 'yes'),
+        'hedge_percentile': float(os.environ.get('BEDROCK_HEDGE_PERCENTILE', '0.95')),
+        'hedge_min_samples': int(os.environ.get('BEDROCK_HEDGE_MIN_SAMPLES', '20')),
+        'unhealthy_after': int(os.environ.get('BEDROCK_UNHEALTHY_AFTER', '3')),
+        'cooldown_seconds': float(os.environ.get('BEDROCK_COOLDOWN_SECONDS', '30')),
+        'max_workers': int(os.environ.get('BEDROCK_POOL_MAX_WORKERS', '32'))
+    }
+
+def _error_code(error: Exception) -> Optional[str]:
+    """botocore ClientError code, if any."""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('Error', {}).get('Code')
+    return None
+
+def _percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def boto3_invoker(region: str, model_id: str, aws_access_key: str, aws_secret_key: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Build an invoker calling Bedrock in one region.
+
+    Args:
+        region: AWS region of the runtime endpoint
+        model_id: Model ID or inference-profile ARN served in that region
+        aws_access_key: AWS access key ID
+        aws_secret_key: AWS secret access key
+
+    Returns:
+        Callable taking a request body and returning the decoded response body
+    """
+    import boto3
+
+    runtime = boto3.client(
+        'bedrock-runtime',
+        aws_access_key_id=aws_access_key,
+        aws_secret_access_key=aws_secret_key,
+        region_name=region
+    )
+
+    def invoke(body: Dict[str, Any]) -> Dict[str, Any]:
+        response = runtime.invoke_model(
+            modelId=model_id,
+            body=json.dumps(body),
+            contentType='application/json'
+        )
+        return json.loads(response['body'].read())
+
+    invoke.runtime = runtime
+    return invoke
+
+class FakeEndpoint:
+    def __init__(self, latency: Union[float, Callable[[], float]] = 0.5, failure_rate: float = 0.0,
+                 response: Optional[Dict[str, Any]] = None, seed: int = 0):
+        """
+        Local stand-in for a regional endpoint, for exercising hedging and failover.
+
+        Args:
+            latency: Seconds per call, or a callable returning them (e.g. a sampled distribution)
+            failure_rate: Fraction of calls that raise
+            response: Response body to return (defaults to the mock invoice)
+            seed: Seed for failure sampling
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.response = response
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.failure_rate
+        time.sleep(self.latency() if callable(self.latency) else self.latency)
+        if fail:
+            raise ConnectionError("Injected endpoint failure")
+        if self.response is not None:
+            return self.response
+
+        from app.mock_bedrock import get_mock_invoice
+        return {
+            'content': [{'type': 'text', 'text': json.dumps(get_mock_invoice())}],
+            'usage': {'input_tokens': 1500, 'output_tokens': 600},
+            'stop_reason': 'end_turn'
+        }
+
+class Endpoint:
+    def __init__(self, name: str, invoker: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 model_id: Optional[str] = None, window: int = 200):
+        """
+        One region/profile in the pool, with its health and latency history.
+
+        Args:
+            name: Label used in logs and metrics (usually the region)
+            invoker: Callable taking a request body and returning the response body
+            model_id: Model ID or inference-profile ARN, for reporting
+            window: Number of recent latencies kept per call kind for percentiles
+        """
+        self.name = name
+        self.invoker = invoker
+        self.model_id = model_id
+        self.window = window
+        # Per call kind: a chat turn and an image extraction have very different latencies
+        self.latencies: Dict[str, deque] = {}
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def record_latency(self, kind: str, latency: float) -> None:
+        self.latencies.setdefault(kind, deque(maxlen=self.window)).append(latency)
+
+    def healthy(self) -> bool:
+        return time.time() >= self.unhealthy_until
+
+class ClientPool:
+    def __init__(self, endpoints: List[Endpoint], stats_store=None, settings: Optional[Dict[str, Any]] = None):
+        """
+        Initialize the pool.
+
+        Args:
+            endpoints: Endpoints in order of preference
+            stats_store: Optional StateStore for metrics shared across workers
+            settings: Overrides for pool_settings()
+        """
+        if not endpoints:
+            raise ValueError("ClientPool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.stats_store = stats_store
+        self.settings = {**pool_settings(), **(settings or {})}
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._executor = ThreadPoolExecutor(max_workers=self.settings['max_workers'], thread_name_prefix='bedrock-pool')
+
+    @classmethod
+    def from_env(cls, aws_access_key: str, aws_secret_key: str, default_region: str, default_model_id: str,
+                 stats_store=None) -> 'ClientPool':
+        """
+        Build a pool from BEDROCK_ENDPOINTS ("region=model_or_profile_arn,...").
+
+        Without BEDROCK_ENDPOINTS the pool has a single endpoint in
+        default_region serving default_model_id.
+        """
+        endpoints = []
+        for entry in os.environ.get('BEDROCK_ENDPOINTS', '').split(','):
+            if not entry.strip():
+                continue
+            region, _, model_id = entry.strip().partition('=')
+            endpoints.append((region.strip(), model_id.strip() or default_model_id))
+        if not endpoints:
+            endpoints = [(default_region, default_model_id)]
+
+        return cls(
+            [Endpoint(region, boto3_invoker(region, model_id, aws_access_key, aws_secret_key), model_id)
+             for region, model_id in endpoints],
+            stats_store=stats_store
+        )
+
+    def _count(self, **amounts) -> None:
+        with self._lock:
+            for key, amount in amounts.items():
+                self._counters[key] = self._counters.get(key, 0) + amount
+        if self.stats_store is not None:
+            try:
+                self.stats_store.increment_many(POOL_STATS_NAMESPACE, amounts)
+            except Exception as e:
+                logger.error(f"Error recording pool metrics: {str(e)}")
+
+    def _candidates(self) -> List[Endpoint]:
+        """Healthy endpoints in preference order, then the unhealthy ones as a last resort."""
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.healthy()]
+        return healthy + [endpoint for endpoint in self.endpoints if endpoint not in healthy]
+
+    def hedge_delay(self, endpoint: Endpoint, kind: str) -> Optional[float]:
+        """
+        Observed latency percentile for this kind after which a hedge is sent.
+
+        Uses the endpoint's own history, or every endpoint's history for the
+        kind while the endpoint is still warming up. None if hedging is off
+        or too few calls of the kind have been seen.
+        """
+        if not self.settings['hedging']:
+            return None
+        with self._lock:
+            samples = list(endpoint.latencies.get(kind, ()))
+            if len(samples) < self.settings['hedge_min_samples']:
+                samples = [latency for other in self.endpoints for latency in other.latencies.get(kind, ())]
+        if len(samples) < self.settings['hedge_min_samples']:
+            return None
+        return _percentile(samples, self.settings['hedge_percentile'])
+
+    def _call(self, endpoint: Endpoint, body: Dict[str, Any], kind: str, outcome: Dict[str, Any],
+              attempt: Dict[str, Any]) -> Any:
+        """Run one attempt and update the endpoint's health; returns (response, won)."""
+        started = time.time()
+        # The hedge timer starts here, so time queued in the executor is not counted as slowness
+        attempt['started_at'] = started
+        attempt['running'].set()
+        try:
+            response = endpoint.invoker(body)
+        except Exception:
+            with self._lock:
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.settings['unhealthy_after']:
+                    endpoint.unhealthy_until = time.time() + self.settings['cooldown_seconds']
+                    logger.warning(f"🚑 Endpoint {endpoint.name} marked unhealthy for {self.settings['cooldown_seconds']}s")
+            self._count(**{f'endpoint:{endpoint.name}|errors': 1})
+            raise
+
+        latency = time.time() - started
+        with self._lock:
+            endpoint.record_latency(kind, latency)
+            endpoint.consecutive_failures = 0
+            endpoint.unhealthy_until = 0.0
+            won = not outcome['decided']
+            outcome['decided'] = True
+        self._count(**{f'endpoint:{endpoint.name}|calls': 1})
+        if not won:
+            # The losing call of a hedge is still billed
+            record_usage('hedge', response.get('usage'))
+        return response, won
+
+    def invoke(self, body: Dict[str, Any], kind: str = 'extraction') -> Dict[str, Any]:
+        """
+        Send a request through the pool.
+
+        Args:
+            body: Anthropic messages request body
+            kind: Call type; hedging uses this kind's observed latencies
+
+        Returns:
+            Decoded response body of the first successful attempt
+
+        Raises:
+            Exception: The last error if every endpoint failed
+        """
+        candidates = self._candidates()
+        primary = candidates[0]
+        remaining = candidates[1:]
+        outcome = {'decided': False}
+        pending = {}
+        last_error: Optional[Exception] = None
+
+        def launch(endpoint: Endpoint, is_hedge: bool) -> Dict[str, Any]:
+            attempt = {'running': threading.Event(), 'started_at': None}
+            # Attempts run in a copy of this context so usage keeps its session/invoice scope
+            future = self._executor.submit(
+                contextvars.copy_context().run, self._call, endpoint, body, kind, outcome, attempt
+            )
+            pending[future] = (endpoint, is_hedge)
+            return attempt
+
+        self._count(requests=1)
+        timed = launch(primary, False)
+        hedge_delay = self.hedge_delay(primary, kind)
+        hedged = False
+
+        while pending:
+            timeout = None
+            if hedge_delay is not None and not hedged:
+                # Only the time since the attempt started running counts towards the p95
+                timed['running'].wait()
+                timeout = max(0.0, timed['started_at'] + hedge_delay - time.time())
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                # With a single endpoint the hedge goes to the same region
+                target = remaining.pop(0) if remaining else primary
+                logger.info(f"🪁 No {kind} response from {primary.name} after {hedge_delay:.2f}s (p95), hedging to {target.name}")
+                self._count(hedges_fired=1)
+                launch(target, True)
+                continue
+
+            for future in done:
+                endpoint, is_hedge = pending.pop(future)
+                try:
+                    response, won = future.result()
+                except Exception as e:
+                    last_error = e
+                    code = _error_code(e)
+                    logger.warning(f"⚠️ Bedrock call to {endpoint.name} failed: {code or str(e)}")
+                    if code in NON_RETRYABLE_ERRORS:
+                        raise
+                    if not pending and remaining:
+                        target = remaining.pop(0)
+                        logger.info(f"🔀 Failing over from {endpoint.name} to {target.name}")
+                        self._count(failovers=1)
+                        attempt = launch(target, is_hedge)
+                        if not is_hedge:
+                            timed = attempt
+                    continue
+                if won:
+                    if is_hedge:
+                        self._count(hedges_won=1)
+                    return response
+
+        raise last_error
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Health and hedging metrics.
+
+        Counters come from the shared stats store when one is configured
+        (all workers), otherwise from this process; health and latency
+        percentiles are always this process's observations.
+        """
+        if self.stats_store is not None:
+            counters = self.stats_store.items(POOL_STATS_NAMESPACE)
+        else:
+            with self._lock:
+                counters = dict(self._counters)
+
+        endpoints = []
+        for endpoint in self.endpoints:
+            with self._lock:
+                by_kind = {kind: list(samples) for kind, samples in endpoint.latencies.items()}
+                failures = endpoint.consecutive_failures
+            latency = {}
+            for kind, samples in by_kind.items():
+                latency[kind] = {
+                    'samples': len(samples),
+                    'p50_seconds': round(_percentile(samples, 0.5), 3),
+                    'p95_seconds': round(_percentile(samples, 0.95), 3)
+                }
+            endpoints.append({
+                'name': endpoint.name,
+                'model_id': endpoint.model_id,
+                'healthy': endpoint.healthy(),
+                'consecutive_failures': failures,
+                'calls': int(counters.get(f'endpoint:{endpoint.name}|calls', 0)),
+                'errors': int(counters.get(f'endpoint:{endpoint.name}|errors', 0)),
+                'latency_by_kind': latency
+            })
+
+        hedges_fired = int(counters.get('hedges_fired', 0))
+        hedges_won = int(counters.get('hedges_won', 0))
+        return {
+            'pid': os.getpid(),
+            'settings': self.settings,
+            'endpoints': endpoints,
+            'requests': int(counters.get('requests', 0)),
+            'hedges_fired': hedges_fired,
+            'hedges_won': hedges_won,
+            'hedge_win_rate': round(hedges_won / hedges_fired, 3) if hedges_fired else None,
+            'failovers': int(counters.get('failovers', 0))
+        }
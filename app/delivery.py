@@ -0,0 +1,141 @@
+"""
+HTTP delivery helpers: fingerprinted, precompressed static assets and
+compressed JSON responses.
+
+At startup every static text asset is hashed and compressed once (gzip, plus
+brotli when the optional ``brotli`` package is installed). Templates link to
+``asset_url('css/style.css')`` which resolves to a content-fingerprinted URL
+that can be cached forever; a new deploy changes the URL, not the cache rules.
+"""
+import os
+import gzip
+import hashlib
+import logging
+import mimetypes
+from typing import Any, Dict, Optional
+
+from flask import Blueprint, Response, abort, current_app, request, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MIN_COMPRESS_BYTES = 1024
+
+assets = Blueprint('assets', __name__)
+
+def _fingerprinted_name(filename: str, digest: str) -> str:
+    """Insert the content hash before the extension: css/style.css -> css/style.<hash>.css"""
+    root, ext = os.path.splitext(filename)
+    return f"{root}.{digest}{ext}"
+
+def _compress(data: bytes) -> Dict[str, bytes]:
+    """Return the precompressed variants of a payload keyed by content coding."""
+    variants = {'gzip': gzip.compress(data, compresslevel=9)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return variants
+
+def choose_encoding(available) -> Optional[str]:
+    """Pick the best content coding the client accepts, preferring brotli."""
+    accepted = request.accept_encodings
+    for coding in ('br', 'gzip'):
+        if coding in available and accepted[coding]:
+            return coding
+    return None
+
+class AssetManifest:
+    def __init__(self, static_folder: str):
+        """
+        Hash and precompress every static asset once per process.
+
+        Args:
+            static_folder: Flask static folder to index
+        """
+        self.static_folder = static_folder
+        self.by_source: Dict[str, str] = {}
+        self.by_fingerprint: Dict[str, Dict[str, Any]] = {}
+        self._build()
+
+    def _build(self) -> None:
+        for dirpath, _, filenames in os.walk(self.static_folder):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                filename = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                ext = os.path.splitext(name)[1].lower()
+                if filename.startswith('uploads/') or ext not in COMPRESSIBLE_EXTENSIONS:
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                fingerprinted = _fingerprinted_name(filename, digest)
+                self.by_source[filename] = fingerprinted
+                self.by_fingerprint[fingerprinted] = {
+                    'data': data,
+                    'etag': digest,
+                    'mimetype': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                    'variants': _compress(data)
+                }
+        logger.info(f"Asset manifest built: {len(self.by_source)} fingerprinted assets")
+
+    def url_for(self, filename: str) -> str:
+        """Fingerprinted URL for a static file, or the plain static URL if unknown."""
+        fingerprinted = self.by_source.get(filename)
+        if fingerprinted is None:
+            return url_for('static', filename=filename)
+        return url_for('assets.fingerprinted_asset', filename=fingerprinted)
+
+@assets.route('/assets/<path:filename>')
+def fingerprinted_asset(filename):
+    """Serve a fingerprinted asset with immutable caching and precompressed bodies."""
+    asset = current_app.extensions['asset_manifest'].by_fingerprint.get(filename)
+    if asset is None:
+        abort(404)
+
+    encoding = choose_encoding(asset['variants'])
+    body = asset['variants'][encoding] if encoding else asset['data']
+    response = Response(body, mimetype=asset['mimetype'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.set_etag(f"{asset['etag']}-{encoding}" if encoding else asset['etag'])
+    return response.make_conditional(request)
+
+def compress_json_response(response: Response) -> Response:
+    """after_request hook: gzip/brotli JSON bodies when the client accepts it."""
+    if (response.mimetype != 'application/json'
+            or response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+
+    encoding = choose_encoding(('br', 'gzip') if brotli is not None else ('gzip',))
+    if encoding is None:
+        return response
+
+    compressed = brotli.compress(data, quality=5) if encoding == 'br' else gzip.compress(data, compresslevel=6)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # The compressed bytes differ from the ones the ETag was computed on
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def init_delivery(app) -> None:
+    """Build the asset manifest and register the delivery blueprint and hooks."""
+    app.extensions['asset_manifest'] = AssetManifest(app.static_folder)
+    app.register_blueprint(assets)
+    app.add_template_global(app.extensions['asset_manifest'].url_for, name='asset_url')
+    app.after_request(compress_json_response)
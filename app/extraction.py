@@ -0,0 +1,312 @@
+"""
+Invoice extraction pipeline shared by the web app and batch tools.
+
+Decides how an invoice is sent to the model: as OCR text when the local
+OCR pre-pass is confident enough, as overlapping tiles when the invoice is
+too long for one response, otherwise as the full image.
+"""
+import os
+import time
+import tempfile
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.ocr import ocr_available, run_ocr
+from app.tiling import extract_invoice_tiled, is_long_invoice, tiling_settings
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow, re-extraction sends the full image
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+OCR_STATS_NAMESPACE = 'ocr_stats'
+
+# Keys added by the pipeline rather than read from the invoice
+METADATA_FIELDS = {
+    'extraction_successful', 'extracted_by', 'extraction_path', 'token_usage',
+    'ocr_confidence', 'field_confidence', 'error', 'json_error', 'raw_extraction',
+    'truncated', 'tiles', 'failed_tiles'
+}
+
+def ocr_settings() -> Dict[str, Any]:
+    """Read OCR pre-pass settings from the environment."""
+    return {
+        'enabled': os.environ.get('OCR_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+        'min_confidence': float(os.environ.get('OCR_MIN_CONFIDENCE', '0.85')),
+        'min_words': int(os.environ.get('OCR_MIN_WORDS', '20'))
+    }
+
+def _record_path(stats_store, path: str, started: float, data: Dict[str, Any]) -> None:
+    """Accumulate count, latency and token totals for one extraction path."""
+    if stats_store is None:
+        return
+    usage = data.get('token_usage') or {}
+    stats_store.increment(OCR_STATS_NAMESPACE, f'{path}.count', 1)
+    stats_store.increment(OCR_STATS_NAMESPACE, f'{path}.latency_seconds', time.time() - started)
+    stats_store.increment(OCR_STATS_NAMESPACE, f'{path}.input_tokens', usage.get('input_tokens', 0))
+    stats_store.increment(OCR_STATS_NAMESPACE, f'{path}.output_tokens', usage.get('output_tokens', 0))
+
+def extract_invoice(client, image_path: str, prompt: str, stats_store=None) -> Dict[str, Any]:
+    """
+    Extract invoice data, preferring the cheaper OCR text path when possible.
+
+    Args:
+        client: BedrockClient (or compatible mock/replay client)
+        image_path: Path to the invoice image
+        prompt: Extraction prompt
+        stats_store: Optional StateStore used to record path statistics
+
+    Returns:
+        Dictionary containing extracted invoice data, with 'extraction_path'
+        set to 'text', 'tiled' or 'image'
+    """
+    if getattr(client, 'deferred', False):
+        # Batch backends answer later with one result per queued call: send the whole image once
+        data = client.extract_invoice_data(image_path, prompt)
+        data['extraction_path'] = 'image'
+        return data
+
+    settings = ocr_settings()
+    if settings['enabled'] and hasattr(client, 'extract_invoice_from_text'):
+        started = time.time()
+        ocr = run_ocr(image_path)
+        if ocr and ocr['confidence'] >= settings['min_confidence'] and ocr['word_count'] >= settings['min_words']:
+            logger.info(f"📝 Using OCR text path (confidence {ocr['confidence']:.2f})")
+            data = client.extract_invoice_from_text(ocr['text'], prompt)
+            if data.get('extraction_successful', True):
+                data['extraction_path'] = 'text'
+                data['ocr_confidence'] = round(ocr['confidence'], 3)
+                _record_path(stats_store, 'text', started, data)
+                return data
+            logger.warning("⚠️ OCR text extraction failed, falling back to image")
+            # OCR plus the failed text call are pure overhead on top of the image path
+            _record_path(stats_store, 'text_fallback', started, data)
+        else:
+            if ocr:
+                logger.info(f"📸 OCR confidence too low ({ocr['confidence']:.2f}), using image path")
+            if ocr_available():
+                # The OCR pass still cost time even though its text was not used
+                _record_path(stats_store, 'ocr_rejected', started, {})
+
+    started = time.time()
+    tiling = tiling_settings()
+    if is_long_invoice(image_path, tiling):
+        logger.info("🧩 Long invoice detected, using tiled extraction")
+        data = extract_invoice_tiled(client, image_path, prompt)
+        data['extraction_path'] = 'tiled'
+        _record_path(stats_store, 'tiled', started, data)
+        return data
+
+    data = client.extract_invoice_data(image_path, prompt)
+    if data.get('truncated') and tiling['enabled']:
+        # Too many line items for one response: retry in tiles
+        logger.warning("⚠️ Extraction was truncated by max_tokens, retrying with tiled extraction")
+        _record_path(stats_store, 'truncated', started, data)
+        started = time.time()
+        data = extract_invoice_tiled(client, image_path, prompt)
+        data['extraction_path'] = 'tiled'
+        _record_path(stats_store, 'tiled', started, data)
+        return data
+
+    data['extraction_path'] = 'image'
+    _record_path(stats_store, 'image', started, data)
+    return data
+
+def ocr_report(stats_store) -> Dict[str, Any]:
+    """
+    Summarize how often the text path is taken and what it saves.
+
+    Args:
+        stats_store: StateStore holding the recorded statistics
+
+    Returns:
+        Dictionary with per-path averages and estimated savings
+    """
+    stats = stats_store.items(OCR_STATS_NAMESPACE)
+    report: Dict[str, Any] = {'settings': ocr_settings(), 'ocr_available': ocr_available(), 'paths': {}}
+    for path in ('text', 'image', 'tiled'):
+        count = stats.get(f'{path}.count', 0)
+        report['paths'][path] = {
+            'count': int(count),
+            'avg_latency_seconds': round(stats.get(f'{path}.latency_seconds', 0) / count, 3) if count else None,
+            'avg_input_tokens': round(stats.get(f'{path}.input_tokens', 0) / count, 1) if count else None,
+            'avg_output_tokens': round(stats.get(f'{path}.output_tokens', 0) / count, 1) if count else None
+        }
+
+    text, image = report['paths']['text'], report['paths']['image']
+    total = text['count'] + image['count'] + report['paths']['tiled']['count']
+    report['total_extractions'] = total
+    report['text_path_rate'] = round(text['count'] / total, 3) if total else None
+    report['text_fallbacks'] = int(stats.get('text_fallback.count', 0))
+    report['ocr_rejections'] = int(stats.get('ocr_rejected.count', 0))
+    report['truncated_retries'] = int(stats.get('truncated.count', 0))
+
+    # Savings are estimated against the average image-path call, minus the OCR
+    # time spent on rejected invoices and the cost of failed text attempts
+    overhead_latency = stats.get('ocr_rejected.latency_seconds', 0) + stats.get('text_fallback.latency_seconds', 0)
+    overhead_tokens = stats.get('text_fallback.input_tokens', 0)
+    if text['count'] and image['count']:
+        report['estimated_savings'] = {
+            'input_tokens': round((image['avg_input_tokens'] - text['avg_input_tokens']) * text['count'] - overhead_tokens),
+            'latency_seconds': round((image['avg_latency_seconds'] - text['avg_latency_seconds']) * text['count'] - overhead_latency, 1),
+            'ocr_overhead_seconds': round(overhead_latency, 1)
+        }
+    else:
+        report['estimated_savings'] = None
+    return report
+
+def _number(value: Any) -> Optional[float]:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def normalize_field_confidence(raw: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Bring the model's field_confidence into one shape.
+
+    Each field maps to {'confidence': float or None, 'bbox': [x0, y0, x1, y1]
+    or None}. A bare number is taken as the confidence; a bbox is kept only
+    if it has four numeric coordinates within 0-1 that span a non-empty box.
+
+    Args:
+        raw: field_confidence as returned by the model (any shape)
+
+    Returns:
+        Normalized confidence entries
+    """
+    if not isinstance(raw, dict):
+        return {}
+    normalized = {}
+    for field, meta in raw.items():
+        score, bbox = (meta.get('confidence'), meta.get('bbox')) if isinstance(meta, dict) else (meta, None)
+        coords = [_number(c) for c in bbox] if isinstance(bbox, (list, tuple)) and len(bbox) == 4 else None
+        if coords is None or any(c is None or not 0.0 <= c <= 1.0 for c in coords) \
+                or coords[2] <= coords[0] or coords[3] <= coords[1]:
+            coords = None
+        normalized[field] = {'confidence': _number(score), 'bbox': coords}
+    return normalized
+
+def low_confidence_fields(data: Dict[str, Any], threshold: Optional[float] = None) -> List[str]:
+    """
+    List top-level fields that are missing or below the confidence threshold.
+
+    Args:
+        data: Extracted invoice data
+        threshold: Minimum acceptable confidence (REEXTRACT_CONFIDENCE_THRESHOLD, default 0.7)
+
+    Returns:
+        Field names that are good candidates for re-extraction
+    """
+    if threshold is None:
+        threshold = float(os.environ.get('REEXTRACT_CONFIDENCE_THRESHOLD', '0.7'))
+    confidence = normalize_field_confidence(data.get('field_confidence'))
+    fields = []
+    for field, value in data.items():
+        if field in METADATA_FIELDS:
+            continue
+        # Fields without an entry were not scored; a null or non-numeric score counts as low
+        meta = confidence.get(field)
+        if value is None or (meta is not None and (meta['confidence'] is None or meta['confidence'] < threshold)):
+            fields.append(field)
+    return fields
+
+def _region_for(fields: List[str], confidence: Dict[str, Dict[str, Any]], padding: float = 0.04) -> Optional[Tuple[float, float, float, float]]:
+    """Union of the fields' bounding boxes (fractions), or None if any box is unknown."""
+    boxes = []
+    for field in fields:
+        bbox = (confidence.get(field) or {}).get('bbox')
+        if bbox is None:
+            return None
+        boxes.append(bbox)
+    x0 = max(0.0, min(b[0] for b in boxes) - padding)
+    y0 = max(0.0, min(b[1] for b in boxes) - padding)
+    x1 = min(1.0, max(b[2] for b in boxes) + padding)
+    y1 = min(1.0, max(b[3] for b in boxes) + padding)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1, y1)
+
+def _crop_image(image_path: str, region: Tuple[float, float, float, float]) -> Optional[str]:
+    """Write the region of the image to a temporary PNG and return its path."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+            box = (int(region[0] * width), int(region[1] * height),
+                   int(region[2] * width), int(region[3] * height))
+            crop = img.crop(box)
+            if crop.mode not in ('RGB', 'L'):
+                crop = crop.convert('RGB')
+            fd, crop_path = tempfile.mkstemp(suffix='.png')
+            os.close(fd)
+            crop.save(crop_path, 'PNG')
+        return crop_path
+    except Exception as e:
+        logger.warning(f"Could not crop {image_path}: {str(e)}")
+        return None
+
+def reextract_fields(client, image_path: str, data: Dict[str, Any],
+                     fields: Optional[List[str]] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Re-extract only missing or low-confidence fields and merge them in.
+
+    The union of the fields' bounding boxes is cropped out of the image so
+    the call sends a small region and asks for a handful of keys, instead of
+    repeating the full-image extraction.
+
+    Args:
+        client: BedrockClient (or compatible mock/replay client)
+        image_path: Path to the original invoice image
+        data: Previously extracted invoice data
+        fields: Fields to re-extract (defaults to low_confidence_fields())
+
+    Returns:
+        Tuple of (merged invoice data, names of fields that were updated)
+    """
+    fields = fields or low_confidence_fields(data)
+    if not fields:
+        return data, []
+
+    confidence = normalize_field_confidence(data.get('field_confidence'))
+    # The OCR text path never showed the model the image, so its boxes are invented
+    region = None if data.get('extraction_path') == 'text' else _region_for(fields, confidence)
+    crop_path = _crop_image(image_path, region) if region else None
+    if crop_path is None:
+        region = (0.0, 0.0, 1.0, 1.0)
+
+    try:
+        result = client.extract_fields(crop_path or image_path, fields)
+    finally:
+        if crop_path:
+            os.remove(crop_path)
+
+    if not result.get('extraction_successful', True):
+        logger.warning(f"⚠️ Field re-extraction failed: {result.get('error', 'Unknown error')}")
+        return data, []
+
+    merged = dict(data)
+    merged_confidence = dict(confidence)
+    new_confidence = normalize_field_confidence(result.get('field_confidence'))
+    x0, y0, x1, y1 = region
+    updated = []
+    for field in fields:
+        if field not in result or result[field] is None:
+            continue
+        merged[field] = result[field]
+        meta = dict(new_confidence.get(field) or {'confidence': None, 'bbox': None})
+        bbox = meta['bbox']
+        if bbox is not None:
+            # Map the box from crop coordinates back to the full image
+            meta['bbox'] = [
+                round(x0 + bbox[0] * (x1 - x0), 4), round(y0 + bbox[1] * (y1 - y0), 4),
+                round(x0 + bbox[2] * (x1 - x0), 4), round(y0 + bbox[3] * (y1 - y0), 4)
+            ]
+        elif data.get('extraction_path') != 'text':
+            meta['bbox'] = (confidence.get(field) or {}).get('bbox')
+        merged_confidence[field] = meta
+        updated.append(field)
+    merged['field_confidence'] = merged_confidence
+
+    logger.info(f"✅ Re-extracted fields: {updated}")
+    return merged, updated
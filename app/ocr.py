@@ -0,0 +1,110 @@
+"""
+Optional CPU-only OCR pre-pass using Tesseract.
+
+When pytesseract/Pillow (and the tesseract binary) are installed, an invoice
+can be turned into a layout-preserving text layer that is far smaller to send
+than the base64 image. Without them, run_ocr() returns None and extraction
+falls back to the vision path.
+"""
+import logging
+from statistics import median
+from typing import Any, Dict, List, Optional
+
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:
+    pytesseract = None
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+def ocr_available() -> bool:
+    """Return True if the OCR dependencies and tesseract binary are usable."""
+    if pytesseract is None:
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def _layout_lines(data: Dict[str, List[Any]]) -> List[str]:
+    """
+    Rebuild text lines from tesseract word boxes, keeping column positions.
+
+    Words are grouped by tesseract's (block, paragraph, line) ids, lines are
+    ordered top to bottom, and each word is padded to a column derived from
+    its x position so tables keep their alignment in plain text.
+    """
+    words = []
+    for i, text in enumerate(data['text']):
+        text = (text or '').strip()
+        if not text or float(data['conf'][i]) < 0:
+            continue
+        words.append({
+            'text': text,
+            'left': int(data['left'][i]),
+            'top': int(data['top'][i]),
+            'width': int(data['width'][i]),
+            'line': (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        })
+    if not words:
+        return []
+
+    char_width = max(1.0, median(w['width'] / len(w['text']) for w in words))
+
+    lines: Dict[Any, List[Dict[str, Any]]] = {}
+    for word in words:
+        lines.setdefault(word['line'], []).append(word)
+
+    ordered = sorted(lines.values(), key=lambda ws: (min(w['top'] for w in ws), min(w['left'] for w in ws)))
+    result = []
+    for line_words in ordered:
+        line = ''
+        for word in sorted(line_words, key=lambda w: w['left']):
+            column = int(word['left'] / char_width)
+            line += ' ' * max(1 if line else 0, column - len(line)) + word['text']
+        result.append(line.rstrip())
+    return result
+
+def run_ocr(image_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Run Tesseract on an invoice image.
+
+    Args:
+        image_path: Path to the invoice image
+
+    Returns:
+        Dictionary with 'text' (layout-preserving), 'confidence' (0-1, weighted
+        by word length) and 'word_count', or None if OCR is unavailable or fails
+    """
+    if pytesseract is None:
+        return None
+    try:
+        with Image.open(image_path) as img:
+            data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        logger.warning(f"OCR failed for {image_path}: {str(e)}")
+        return None
+
+    total_chars = 0
+    weighted_conf = 0.0
+    word_count = 0
+    for text, conf in zip(data['text'], data['conf']):
+        text = (text or '').strip()
+        conf = float(conf)
+        if not text or conf < 0:
+            continue
+        word_count += 1
+        total_chars += len(text)
+        weighted_conf += conf * len(text)
+
+    confidence = (weighted_conf / total_chars / 100.0) if total_chars else 0.0
+    text = '\n'.join(_layout_lines(data))
+    logger.info(f"OCR produced {word_count} words ({len(text)} characters), confidence {confidence:.2f}")
+    return {
+        'text': text,
+        'confidence': confidence,
+        'word_count': word_count
+    }
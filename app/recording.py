@@ -0,0 +1,91 @@
+"""
+Fixture archive format for recording Bedrock traffic.
+
+Each line of the archive is one call: the request (with base64 image data
+replaced by its hash and size, so archives stay small but payload sizes are
+preserved), the full response body and the observed latency.
+"""
+import os
+import json
+import time
+import copy
+import hashlib
+import threading
+import logging
+from typing import Any, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+def summarize_request(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy a request body with image payloads replaced by their digest and size.
+
+    Args:
+        body: Anthropic messages request body
+
+    Returns:
+        Request body safe to store in a fixture archive
+    """
+    summary = copy.deepcopy(body)
+    for message in summary.get('messages', []):
+        content = message.get('content')
+        if not isinstance(content, list):
+            continue
+        for block in content:
+            source = block.get('source') if isinstance(block, dict) else None
+            if source and source.get('type') == 'base64':
+                data = source.pop('data', '')
+                source['sha256'] = hashlib.sha256(data.encode('utf-8')).hexdigest()
+                source['size'] = len(data)
+    return summary
+
+def request_key(summary: Dict[str, Any]) -> str:
+    """Stable hash of a summarized request, used to match replays exactly."""
+    return hashlib.sha256(json.dumps(summary, sort_keys=True).encode('utf-8')).hexdigest()
+
+class FixtureRecorder:
+    def __init__(self, archive_path: str):
+        """
+        Append-only recorder for Bedrock request/response pairs.
+
+        Args:
+            archive_path: JSONL file the calls are appended to
+        """
+        self.archive_path = archive_path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(archive_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        logger.info(f"🎙️ Recording Bedrock calls to: {archive_path}")
+
+    def record(self, kind: str, body: Dict[str, Any], response_body: Dict[str, Any], latency: float) -> None:
+        """
+        Append one call to the archive.
+
+        Args:
+            kind: Call type ('extraction', 'text_extraction', 'field_extraction', 'chat')
+            body: Request body that was sent
+            response_body: Decoded response body
+            latency: Wall-clock seconds the call took
+        """
+        summary = summarize_request(body)
+        entry = {
+            'kind': kind,
+            'key': request_key(summary),
+            'request': summary,
+            'request_bytes': len(json.dumps(body)),
+            'response': response_body,
+            'latency_seconds': round(latency, 4),
+            'recorded_at': time.time()
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.archive_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+def read_archive(archive_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the recorded calls from a fixture archive."""
+    with open(archive_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
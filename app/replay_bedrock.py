@@ -0,0 +1,77 @@
+"""
+Replay Bedrock client for deterministic, production-shaped performance tests.
+
+Serves responses from a fixture archive written by BedrockClient in record
+mode (BEDROCK_RECORD_PATH) and sleeps for latencies drawn from the recorded
+distribution of each call type. Only the raw _invoke() call is replaced, so
+request building (image encoding included), response parsing and usage
+accounting run exactly as they do against AWS.
+"""
+import random
+import time
+import threading
+import logging
+from typing import Any, Dict, List
+
+from app.bedrock_client import BedrockClient
+from app.recording import read_archive, request_key, summarize_request
+
+logger = logging.getLogger(__name__)
+
+class ReplayBedrockClient(BedrockClient):
+    def __init__(self, archive_path: str, latency_scale: float = 1.0, seed: int = 0):
+        """
+        Load a fixture archive for replay.
+
+        Args:
+            archive_path: JSONL archive recorded by BedrockClient
+            latency_scale: Multiplier applied to replayed latencies (0 disables sleeping)
+            seed: Seed for latency sampling, so runs are repeatable
+        """
+        self.model_id = 'replay'
+        self.recorder = None
+        self.latency_scale = latency_scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, Dict[str, Any]] = {}
+        self._by_kind: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+
+        for entry in read_archive(archive_path):
+            self._by_key.setdefault(entry['key'], entry)
+            self._by_kind.setdefault(entry['kind'], []).append(entry)
+
+        if not self._by_kind:
+            raise ValueError(f"Fixture archive is empty: {archive_path}")
+        counts = {kind: len(entries) for kind, entries in self._by_kind.items()}
+        logger.info(f"▶️ Replay Bedrock client loaded {sum(counts.values())} calls from {archive_path}: {counts}")
+
+    def _invoke(self, body: Dict[str, Any], kind: str) -> Dict[str, Any]:
+        """
+        Return a recorded response after a recorded-distribution delay.
+
+        An exact request match is preferred; otherwise recorded calls of the
+        same kind are served round-robin so response sizes follow the archive.
+
+        Args:
+            body: Anthropic messages request body
+            kind: Call type
+
+        Returns:
+            Recorded response body
+        """
+        entry = self._by_key.get(request_key(summarize_request(body)))
+        with self._lock:
+            candidates = self._by_kind.get(kind)
+            if entry is None:
+                if not candidates:
+                    raise KeyError(f"No recorded calls of kind '{kind}' to replay")
+                index = self._cursor.get(kind, 0)
+                entry = candidates[index % len(candidates)]
+                self._cursor[kind] = index + 1
+            # Sample latency from the whole distribution for this kind, not just the matched call
+            latency = self._random.choice(candidates or [entry])['latency_seconds']
+
+        if self.latency_scale > 0:
+            time.sleep(latency * self.latency_scale)
+        return entry['response']
@@ -1,13 +1,17 @@
-from flask import Blueprint, render_template, request, jsonify, current_app, session, flash, redirect, url_for, send_from_directory
+from flask import Blueprint, render_template, request, jsonify, current_app, session, flash, redirect, url_for, send_from_directory, send_file
 import os
 import json
 import logging
+import threading
 from werkzeug.utils import secure_filename
 
 from app.bedrock_client import BedrockClient
 from app.mock_bedrock import MockBedrockClient
+from app.replay_bedrock import ReplayBedrockClient
 from app.simple_chatbot import SimpleChatbot
-from app.utils import allowed_file, save_uploaded_file, format_json_for_display, load_prompt_template
+from app.extraction import METADATA_FIELDS, extract_invoice, ocr_report, reextract_fields, low_confidence_fields
+from app.usage import BudgetExceeded, get_usage_tracker, usage_scope
+from app.utils import allowed_file
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,26 +20,72 @@ logger = logging.getLogger(__name__)
 # Create blueprint
 main = Blueprint('main', __name__)
 
-# Initialize global instances
-# Try to use real Bedrock client, fallback to mock if AWS credentials are missing
-try:
-    bedrock_client = BedrockClient()
-    logger.info("✅ Real AWS Bedrock client initialized successfully")
-except Exception as e:
-    logger.warning(f"⚠️ AWS Bedrock client failed to initialize: {str(e)}")
-    logger.info("🔄 Falling back to Mock Bedrock client for testing")
-    bedrock_client = MockBedrockClient()
+# Per-process instances, created lazily inside each worker.
+# boto3 clients are not fork-safe, so a client inherited from a parent
+# process (gunicorn --preload, multiprocessing) is discarded and rebuilt.
+_bedrock_client = None
+_bedrock_client_pid = None
+_client_lock = threading.Lock()
 
-chatbot = None  # Initialize lazily to avoid memory issues
+def get_bedrock_client():
+    """Return this worker's Bedrock client, falling back to the mock if AWS is unavailable."""
+    global _bedrock_client, _bedrock_client_pid
+    if _bedrock_client is None or _bedrock_client_pid != os.getpid():
+        with _client_lock:
+            if _bedrock_client is None or _bedrock_client_pid != os.getpid():
+                replay_archive = os.environ.get('BEDROCK_REPLAY_ARCHIVE')
+                if replay_archive:
+                    # No mock fallback: a missing or empty archive must fail loudly, not
+                    # quietly benchmark the mock client instead of the recorded traffic
+                    _bedrock_client = ReplayBedrockClient(
+                        replay_archive,
+                        latency_scale=float(os.environ.get('BEDROCK_REPLAY_LATENCY_SCALE', '1.0'))
+                    )
+                    logger.info(f"▶️ Replaying recorded Bedrock traffic from: {replay_archive}")
+                else:
+                    # Try to use real Bedrock client, fallback to mock if AWS credentials are missing
+                    try:
+                        _bedrock_client = BedrockClient(stats_store=get_state_store())
+                        logger.info(f"✅ Real AWS Bedrock client initialized successfully (pid {os.getpid()})")
+                    except Exception as e:
+                        logger.warning(f"⚠️ AWS Bedrock client failed to initialize: {str(e)}")
+                        logger.info("🔄 Falling back to Mock Bedrock client for testing")
+                        _bedrock_client = MockBedrockClient()
+                _bedrock_client_pid = os.getpid()
+    return _bedrock_client
 
-def get_chatbot():
-    """Lazy initialization of chatbot to avoid startup memory issues."""
-    global chatbot
-    if chatbot is None:
-        logger.info("Initializing simple chatbot (lazy loading)...")
-        chatbot = SimpleChatbot()
-        logger.info("Simple chatbot initialized successfully")
-    return chatbot
+def get_state_store():
+    """Return the state store shared by all worker processes."""
+    return current_app.extensions['state_store']
+
+def get_blob_store():
+    """Return the content-addressed upload store."""
+    return current_app.extensions['blob_store']
+
+def get_session_invoice():
+    """Return the invoice extracted for the current session, if any."""
+    session_id = session.get('session_id')
+    if not session_id:
+        return None
+    return get_state_store().get('invoice', session_id)
+
+def budget_exceeded_response(error):
+    """429 response for a call refused by the usage budget."""
+    response = jsonify({
+        'success': False,
+        'error': f'{str(error)}. Please try again later.'
+    })
+    response.status_code = 429
+    if error.retry_after:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def conditional_json(response):
+    """Tag a per-session JSON response with an ETag and answer 304 when unchanged."""
+    response.add_etag()
+    # Revalidate on every poll, but let the browser reuse the body on 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 @main.before_request
 def make_session_permanent():
@@ -54,7 +104,7 @@ def chat():
     """Chat interface page."""
     logger.info("=== CHAT PAGE REQUESTED ===")
     logger.info(f"Session keys: {list(session.keys())}")
-    logger.info(f"Has invoice data: {'invoice_data' in session}")
+    logger.info(f"Has invoice data: {get_session_invoice() is not None}")
     
     try:
         return render_template('chat.html')
@@ -122,19 +172,32 @@ def upload_invoice():
                 'error': 'Invalid file type. Please upload an image file (PNG, JPG, JPEG, GIF, BMP, WEBP)'
             }), 400
         
-        # Save uploaded file
-        file_path = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
+        # Refuse (or throttle) before doing any work if a token/cost budget is exhausted
+        session['session_id'] = session.get('session_id', os.urandom(16).hex())
+        try:
+            get_usage_tracker().check_budget(session['session_id'])
+        except BudgetExceeded as e:
+            error_response = budget_exceeded_response(e)
+            for key, value in response_headers.items():
+                error_response.headers[key] = value
+            return error_response
         
-        # Load prompt template
-        prompt_file = os.path.join(os.path.dirname(__file__), 'prompts', 'invoice_prompt.txt')
-        prompt = load_prompt_template(prompt_file)
+        # Store upload in the content-addressed blob store (identical files are stored once)
+        blob = get_blob_store().put(file)
+        file_path = blob['path']
+        
+        # Prompt template is preloaded by create_app()
+        prompt = current_app.config['INVOICE_PROMPT']
+        bedrock_client = get_bedrock_client()
         
         # Extract data using AWS Bedrock Claude 3.5 Vision
         logger.info(f"🔍 Extracting invoice data from: {file_path}")
-        logger.info(f"📄 Using prompt template: {prompt_file}")
         logger.info(f"🤖 Using client type: {type(bedrock_client).__name__}")
         
-        extracted_data = bedrock_client.extract_invoice_data(file_path, prompt)
+        # Usage is reported without authentication, so it is keyed by an opaque id, never the blob name
+        invoice_id = os.urandom(8).hex()
+        with usage_scope(session_id=session['session_id'], invoice_id=invoice_id):
+            extracted_data = extract_invoice(bedrock_client, file_path, prompt, stats_store=get_state_store())
         
         # Log extraction results
         if isinstance(extracted_data, dict):
@@ -146,35 +209,29 @@ def upload_invoice():
         else:
             logger.warning("⚠️ Unexpected extraction result format")
         
-        # Store in session for chatbot
-        session['invoice_data'] = extracted_data
-        session['invoice_file'] = os.path.basename(file_path)
-        session['invoice_file_path'] = file_path  # Store full path for serving
-        session['session_id'] = session.get('session_id', os.urandom(16).hex())
+        # Keep only identifiers in the cookie; the invoice itself goes to the
+        # shared store so every worker process can see it
+        session['invoice_file'] = blob['original_filename']
+        session['invoice_blob'] = blob['name']
+        session['invoice_id'] = invoice_id
+        get_state_store().set('invoice', session['session_id'], extracted_data,
+                              ttl=current_app.config['PERMANENT_SESSION_LIFETIME'])
         
-        logger.info(f"=== INVOICE DATA STORED IN SESSION ===")
+        logger.info(f"=== INVOICE DATA STORED ===")
         logger.info(f"Session ID: {session.get('session_id')}")
         logger.info(f"Invoice file: {session.get('invoice_file')}")
         logger.info(f"Session keys after storing: {list(session.keys())}")
         logger.info(f"Invoice data keys: {list(extracted_data.keys()) if isinstance(extracted_data, dict) else 'Not a dict'}")
         
-        # Update chatbot with new data
-        if extracted_data.get('extraction_successful', True):
-            chatbot_instance = get_chatbot()
-            chatbot_instance.update_invoice_data(extracted_data)
-            logger.info("Updated chatbot with new invoice data")
-        else:
-            logger.warning("Invoice extraction was not successful, skipping chatbot update")
-        
-        # Clean up uploaded file (optional - comment out if you want to keep files)
-        # os.remove(file_path)
+        if not extracted_data.get('extraction_successful', True):
+            logger.warning("Invoice extraction was not successful")
         
         response = jsonify({
             'success': True,
             'data': extracted_data,
-            'formatted_data': format_json_for_display(extracted_data),
-            'image_url': f'/uploads/{os.path.basename(file_path)}',
-            'invoice_file': os.path.basename(file_path)
+            'image_url': url_for('main.uploaded_file', filename=blob['name']),
+            'thumbnail_url': url_for('main.uploaded_thumbnail', filename=blob['name']),
+            'invoice_file': blob['original_filename']
         })
         
         # Add CORS headers to success response
@@ -240,9 +297,9 @@ def chat_message():
                 'error': 'Empty message'
             }), 400
         
-        # Check if we have invoice data in session
-        invoice_data = session.get('invoice_data')
-        logger.info(f"Invoice data in session: {bool(invoice_data)}")
+        # Check if we have invoice data for this session
+        invoice_data = get_session_invoice()
+        logger.info(f"Invoice data for session: {bool(invoice_data)}")
         logger.info(f"Session keys: {list(session.keys())}")
         
         if not invoice_data:
@@ -254,14 +311,22 @@ def chat_message():
         
         # Get context from chatbot (RAG)
         logger.info("Getting context from chatbot RAG system...")
-        chatbot_instance = get_chatbot()
+        # SimpleChatbot is cheap, so use one per request rather than a global
+        # that concurrent sessions (and other workers) would overwrite
+        chatbot_instance = SimpleChatbot()
+        chatbot_instance.update_invoice_data(invoice_data)
         context = chatbot_instance.get_context_for_question(user_message)
         logger.info(f"RAG context length: {len(context) if context else 0}")
         logger.info(f"RAG context preview: {context[:200] if context else 'None'}...")
         
         # Get response from Claude
         logger.info("Sending request to Claude...")
-        response = bedrock_client.chat_with_claude(user_message, context)
+        try:
+            get_usage_tracker().check_budget(session.get('session_id'))
+        except BudgetExceeded as e:
+            return budget_exceeded_response(e)
+        with usage_scope(session_id=session.get('session_id'), invoice_id=session.get('invoice_id')):
+            response = get_bedrock_client().chat_with_claude(user_message, context)
         logger.info(f"Claude response length: {len(response) if response else 0}")
         logger.info(f"Claude response preview: {response[:200] if response else 'None'}...")
         
@@ -296,10 +361,65 @@ def chat_message():
             
         return error_response, 500
 
+@main.route('/invoice/reextract', methods=['POST'])
+def reextract_invoice_fields():
+    """Re-extract missing or low-confidence fields from a crop of the stored invoice."""
+    try:
+        invoice_data = get_session_invoice()
+        invoice_blob = session.get('invoice_blob')
+        image_path = get_blob_store().path_for(invoice_blob) if invoice_blob else None
+        if not invoice_data or image_path is None:
+            return jsonify({
+                'success': False,
+                'error': 'No invoice data available. Please upload an invoice first.'
+            }), 400
+        
+        data = request.get_json(silent=True) or {}
+        fields = data.get('fields') or low_confidence_fields(invoice_data)
+        if not isinstance(fields, list) or not all(isinstance(f, str) for f in fields):
+            return jsonify({
+                'success': False,
+                'error': 'fields must be a list of field names'
+            }), 400
+        reserved = sorted(set(fields) & METADATA_FIELDS)
+        if reserved:
+            return jsonify({
+                'success': False,
+                'error': f'Cannot re-extract pipeline metadata fields: {", ".join(reserved)}'
+            }), 400
+        
+        logger.info(f"🎯 Re-extracting fields: {fields}")
+        try:
+            get_usage_tracker().check_budget(session.get('session_id'))
+        except BudgetExceeded as e:
+            return budget_exceeded_response(e)
+        with usage_scope(session_id=session.get('session_id'), invoice_id=session.get('invoice_id')):
+            merged_data, updated_fields = reextract_fields(get_bedrock_client(), image_path, invoice_data, fields)
+        
+        if updated_fields:
+            get_state_store().set('invoice', session['session_id'], merged_data,
+                                  ttl=current_app.config['PERMANENT_SESSION_LIFETIME'])
+        
+        return jsonify({
+            'success': True,
+            'data': merged_data,
+            'requested_fields': fields,
+            'updated_fields': updated_fields
+        })
+    except Exception as e:
+        logger.error(f"Error re-extracting fields: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Error re-extracting fields: {str(e)}'
+        }), 500
+
 @main.route('/clear_session', methods=['POST'])
 def clear_session():
     """Clear session data."""
     try:
+        session_id = session.get('session_id')
+        if session_id:
+            get_state_store().delete('invoice', session_id)
         session.clear()
         return jsonify({
             'success': True,
@@ -312,16 +432,35 @@ def clear_session():
             'error': f'Error clearing session: {str(e)}'
         }), 500
 
+# Blob names are content hashes, so a URL always refers to the same bytes
+BLOB_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 @main.route('/uploads/<filename>')
 def uploaded_file(filename):
-    """Serve uploaded files."""
+    """Serve uploaded files with ETag, Range and long-lived caching."""
     try:
-        uploads_dir = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-        return send_from_directory(uploads_dir, filename)
+        path = get_blob_store().path_for(filename)
+        if path is None:
+            # Files saved before the blob store was introduced
+            uploads_dir = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+            return send_from_directory(uploads_dir, filename)
+        response = send_file(path, conditional=True, etag=filename[:64])
+        response.headers['Cache-Control'] = BLOB_CACHE_CONTROL
+        return response
     except Exception as e:
         logger.error(f"Error serving file {filename}: {str(e)}")
         return "File not found", 404
 
+@main.route('/uploads/<filename>/thumbnail')
+def uploaded_thumbnail(filename):
+    """Serve the small preview of an upload, or the original if none exists."""
+    path = get_blob_store().thumbnail_path_for(filename)
+    if path is None:
+        return redirect(url_for('main.uploaded_file', filename=filename))
+    response = send_file(path, mimetype='image/jpeg', conditional=True, etag=f"{filename[:64]}-thumb")
+    response.headers['Cache-Control'] = BLOB_CACHE_CONTROL
+    return response
+
 @main.route('/test', methods=['GET', 'POST'])
 def test_endpoint():
     """Simple test endpoint for debugging fetch issues."""
@@ -340,21 +479,93 @@ def test_endpoint():
 
 @main.route('/status')
 def status():
-    """Get current session status."""
+    """Get current session status (polled by chat.js; supports If-None-Match)."""
     try:
-        has_invoice = 'invoice_data' in session
+        has_invoice = get_session_invoice() is not None
         invoice_file = session.get('invoice_file', None)
-        image_url = f'/uploads/{invoice_file}' if invoice_file else None
+        invoice_blob = session.get('invoice_blob', None)
+        image_url = url_for('main.uploaded_file', filename=invoice_blob) if invoice_blob else None
+        thumbnail_url = url_for('main.uploaded_thumbnail', filename=invoice_blob) if invoice_blob else None
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'has_invoice': has_invoice,
             'invoice_file': invoice_file,
-            'image_url': image_url
+            'image_url': image_url,
+            'thumbnail_url': thumbnail_url
         })
+        return conditional_json(response)
     except Exception as e:
         logger.error(f"Error getting status: {str(e)}")
         return jsonify({
             'success': False,
             'error': f'Error getting status: {str(e)}'
         }), 500
+
+@main.route('/invoice')
+def get_invoice():
+    """Return the current session's extracted invoice (supports If-None-Match)."""
+    invoice_data = get_session_invoice()
+    if invoice_data is None:
+        return jsonify({
+            'success': False,
+            'error': 'No invoice data available. Please upload an invoice first.'
+        }), 404
+    
+    response = jsonify({
+        'success': True,
+        'data': invoice_data,
+        'invoice_file': session.get('invoice_file')
+    })
+    return conditional_json(response)
+
+@main.route('/ocr/stats')
+def ocr_stats():
+    """Report how often the OCR text path is used and its latency/token savings."""
+    try:
+        return jsonify({
+            'success': True,
+            **ocr_report(get_state_store())
+        })
+    except Exception as e:
+        logger.error(f"Error building OCR report: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Error building OCR report: {str(e)}'
+        }), 500
+
+@main.route('/usage')
+def usage_report():
+    """Report token usage and cost globally, per day, per call type and per invoice."""
+    try:
+        return jsonify({
+            'success': True,
+            **get_usage_tracker().report(session_id=session.get('session_id'))
+        })
+    except Exception as e:
+        logger.error(f"Error building usage report: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Error building usage report: {str(e)}'
+        }), 500
+
+@main.route('/bedrock/pool')
+def bedrock_pool():
+    """Report per-region health, latency percentiles, hedges fired/won and failovers."""
+    pool = getattr(get_bedrock_client(), 'pool', None)
+    if pool is None:
+        return jsonify({
+            'success': False,
+            'error': 'The active Bedrock client does not use a regional pool'
+        }), 404
+    try:
+        return jsonify({
+            'success': True,
+            **pool.report()
+        })
+    except Exception as e:
+        logger.error(f"Error building pool report: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Error building pool report: {str(e)}'
+        }), 500
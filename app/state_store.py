@@ -0,0 +1,224 @@
+"""
+SQLite-backed state shared by every worker process.
+
+Flask's cookie session only carries small identifiers; anything that has to be
+visible to all uvicorn/gunicorn workers (extracted invoices, caches, counters)
+lives here instead of in module-level globals.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class StateStore:
+    def __init__(self, db_path: str, timeout: float = 30.0):
+        """
+        Initialize the shared state store.
+
+        Args:
+            db_path: Path to the SQLite database file
+            timeout: Seconds to wait on a locked database before failing
+        """
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS kv (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    expires_at REAL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv (namespace, expires_at)")
+        logger.info(f"Shared state store ready at: {db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return a connection owned by the current process and thread."""
+        conn = getattr(self._local, 'conn', None)
+        # A connection inherited across fork() must never be reused
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """
+        Read a value, ignoring entries that have expired.
+
+        Args:
+            namespace: Logical group of keys (e.g. 'invoice')
+            key: Key within the namespace
+            default: Value returned when the key is missing or expired
+
+        Returns:
+            Stored value decoded from JSON
+        """
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Write a value, replacing any existing entry.
+
+        Args:
+            namespace: Logical group of keys
+            key: Key within the namespace
+            value: JSON-serializable value
+            ttl: Optional lifetime in seconds
+        """
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, ensure_ascii=False), now, expires_at)
+        )
+
+    def delete(self, namespace: str, key: str) -> None:
+        """Remove a key if present."""
+        self._connect().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace: str, prefix: str = '') -> Dict[str, Any]:
+        """Return every live key/value pair in a namespace, optionally by key prefix."""
+        rows = self._connect().execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND substr(key, 1, ?) = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, len(prefix), prefix, time.time())
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def increment(self, namespace: str, key: str, amount: float = 1) -> float:
+        """
+        Atomically add to a numeric value, starting from zero.
+
+        Args:
+            namespace: Logical group of keys
+            key: Key within the namespace
+            amount: Value to add (may be negative)
+
+        Returns:
+            The new value
+        """
+        return self.increment_many(namespace, {key: amount})[key]
+
+    def increment_many(self, namespace: str, amounts: Dict[str, float], ttl: Optional[float] = None) -> Dict[str, float]:
+        """
+        Atomically add to several numeric values in one transaction.
+
+        Args:
+            namespace: Logical group of keys
+            amounts: Mapping of key to the value to add
+            ttl: Seconds until the values expire, counted from this update (None = never)
+
+        Returns:
+            Mapping of key to its new value
+        """
+        conn = self._connect()
+        results = {}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            expires_at = now + ttl if ttl else None
+            for key, amount in amounts.items():
+                row = conn.execute(
+                    "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                # An expired value that has not been purged yet starts again from zero
+                live = row is not None and (row[1] is None or row[1] > now)
+                value = (json.loads(row[0]) if live else 0) + amount
+                conn.execute(
+                    "INSERT OR REPLACE INTO kv (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value), now, expires_at)
+                )
+                results[key] = value
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    def pop_expired(self, namespace: str, limit: int = 500) -> Dict[str, Any]:
+        """
+        Remove and return expired entries, oldest first.
+
+        Uses the expiry index, so the cost depends on the number of expired
+        entries rather than the size of the namespace. An entry refreshed by
+        another process between the select and the delete is left alone.
+
+        Args:
+            namespace: Namespace to sweep
+            limit: Maximum number of entries to remove in one call
+
+        Returns:
+            Mapping of removed keys to their last values
+        """
+        conn = self._connect()
+        now = time.time()
+        rows = conn.execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ? "
+            "ORDER BY expires_at LIMIT ?",
+            (namespace, now, limit)
+        ).fetchall()
+        removed = {}
+        for key, value in rows:
+            cursor = conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, key, now)
+            )
+            if cursor.rowcount:
+                removed[key] = json.loads(value)
+        return removed
+
+    def purge_expired(self, namespace: Optional[str] = None) -> int:
+        """
+        Delete expired entries.
+
+        Args:
+            namespace: Restrict the purge to one namespace
+
+        Returns:
+            Number of entries removed
+        """
+        if namespace is None:
+            cursor = self._connect().execute(
+                "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )
+        else:
+            cursor = self._connect().execute(
+                "DELETE FROM kv WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+                (namespace, time.time())
+            )
+        return cursor.rowcount
+
+_stores: Dict[str, StateStore] = {}
+_stores_lock = threading.Lock()
+
+def get_state_store(db_path: str) -> StateStore:
+    """Return the process-wide store for a database path, creating it once."""
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = StateStore(db_path)
+            _stores[db_path] = store
+        return store
@@ -443,9 +443,13 @@ function updateInvoiceImage(statusData) {
     console.log('Updating invoice image...', statusData);
     
     if (statusData.has_invoice && statusData.image_url) {
-        // Show image
+        // Show preview thumbnail; zoom and download use the original image
         if (invoiceImage) {
-            invoiceImage.src = statusData.image_url;
+            invoiceImage.dataset.fullSrc = statusData.image_url;
+            const previewUrl = statusData.thumbnail_url || statusData.image_url;
+            if (invoiceImage.getAttribute('src') !== previewUrl) {
+                invoiceImage.src = previewUrl;
+            }
             invoiceImage.classList.remove('d-none');
         }
         
@@ -0,0 +1,18 @@
+// Initialize chat on page load
+document.addEventListener('DOMContentLoaded', function() {
+    checkStatus();
+});
+
+// Toggle advanced questions
+function toggleAdvancedQuestions() {
+    const advancedQuestions = document.getElementById('advancedQuestions');
+    const toggleBtn = document.getElementById('advancedToggle');
+
+    if (advancedQuestions.classList.contains('d-none')) {
+        advancedQuestions.classList.remove('d-none');
+        toggleBtn.innerHTML = '<i class="fas fa-chevron-up me-1"></i>Show Fewer Questions';
+    } else {
+        advancedQuestions.classList.add('d-none');
+        toggleBtn.innerHTML = '<i class="fas fa-chevron-down me-1"></i>Show More Questions';
+    }
+}
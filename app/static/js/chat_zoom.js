@@ -0,0 +1,173 @@
+// Image zoom functionality
+let currentZoom = 1;
+const zoomStep = 0.2;
+const minZoom = 0.5;
+const maxZoom = 3;
+
+// Chat screen zoom functionality
+let chatCurrentZoom = 1;
+const chatZoomStep = 0.2;
+const chatMinZoom = 0.5;
+const chatMaxZoom = 2;
+
+function chatZoomIn() {
+    if (chatCurrentZoom < chatMaxZoom) {
+        chatCurrentZoom = Math.min(chatCurrentZoom + chatZoomStep, chatMaxZoom);
+        applyChatZoom();
+    }
+}
+
+function chatZoomOut() {
+    if (chatCurrentZoom > chatMinZoom) {
+        chatCurrentZoom = Math.max(chatCurrentZoom - chatZoomStep, chatMinZoom);
+        applyChatZoom();
+    }
+}
+
+function chatResetZoom() {
+    chatCurrentZoom = 1;
+    applyChatZoom();
+}
+
+function applyChatZoom() {
+    const invoiceImage = document.getElementById('invoiceImage');
+    const chatZoomLevel = document.getElementById('chatZoomLevel');
+    const demoChatZoomLevel = document.getElementById('demoChatZoomLevel');
+
+    if (invoiceImage && !invoiceImage.classList.contains('d-none')) {
+        invoiceImage.style.transform = `scale(${chatCurrentZoom})`;
+        invoiceImage.style.transformOrigin = 'center';
+        if (chatZoomLevel) chatZoomLevel.textContent = `${Math.round(chatCurrentZoom * 100)}%`;
+    }
+
+    // Update demo zoom level indicator
+    if (demoChatZoomLevel) {
+        demoChatZoomLevel.textContent = `${Math.round(chatCurrentZoom * 100)}%`;
+    }
+}
+
+// Demo chat zoom functions
+function demoChatZoomIn() {
+    chatZoomIn();
+}
+
+function demoChatZoomOut() {
+    chatZoomOut();
+}
+
+function demoChatResetZoom() {
+    chatResetZoom();
+}
+
+function openImageZoom() {
+    const invoiceImage = document.getElementById('invoiceImage');
+    const zoomedImage = document.getElementById('zoomedImage');
+    const modalFileName = document.getElementById('modalFileName');
+    const invoiceFileName = document.getElementById('invoiceFileName');
+
+    if (invoiceImage.src) {
+        zoomedImage.src = invoiceImage.dataset.fullSrc || invoiceImage.src;
+        modalFileName.textContent = invoiceFileName.textContent;
+        resetZoom();
+
+        const modal = new bootstrap.Modal(document.getElementById('imageZoomModal'));
+        modal.show();
+    }
+}
+
+function zoomIn() {
+    if (currentZoom < maxZoom) {
+        currentZoom = Math.min(currentZoom + zoomStep, maxZoom);
+        applyZoom();
+    }
+}
+
+function zoomOut() {
+    if (currentZoom > minZoom) {
+        currentZoom = Math.max(currentZoom - zoomStep, minZoom);
+        applyZoom();
+    }
+}
+
+function resetZoom() {
+    currentZoom = 1;
+    applyZoom();
+}
+
+function applyZoom() {
+    const zoomedImage = document.getElementById('zoomedImage');
+    const zoomLevel = document.getElementById('zoomLevel');
+
+    zoomedImage.style.transform = `scale(${currentZoom})`;
+    zoomLevel.textContent = `${Math.round(currentZoom * 100)}%`;
+}
+
+function toggleFullscreen() {
+    const modal = document.getElementById('imageZoomModal');
+
+    if (!document.fullscreenElement) {
+        modal.requestFullscreen().catch(err => {
+            console.log(`Error attempting to enable fullscreen: ${err.message}`);
+        });
+    } else {
+        document.exitFullscreen();
+    }
+}
+
+function downloadImage() {
+    const invoiceImage = document.getElementById('invoiceImage');
+    const invoiceFileName = document.getElementById('invoiceFileName');
+
+    if (invoiceImage.src) {
+        const link = document.createElement('a');
+        link.href = invoiceImage.dataset.fullSrc || invoiceImage.src;
+        link.download = invoiceFileName.textContent || 'invoice.jpg';
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+    }
+}
+
+// Mouse wheel zoom in modal
+document.getElementById('imageZoomModal').addEventListener('wheel', function(e) {
+    if (e.ctrlKey) {
+        e.preventDefault();
+        if (e.deltaY < 0) {
+            zoomIn();
+        } else {
+            zoomOut();
+        }
+    }
+});
+
+// Keyboard shortcuts for zoom
+document.addEventListener('keydown', function(e) {
+    const modal = document.getElementById('imageZoomModal');
+    if (modal.classList.contains('show')) {
+        switch(e.key) {
+            case '+':
+            case '=':
+                e.preventDefault();
+                zoomIn();
+                break;
+            case '-':
+                e.preventDefault();
+                zoomOut();
+                break;
+            case '0':
+                e.preventDefault();
+                resetZoom();
+                break;
+            case 'f':
+            case 'F':
+                e.preventDefault();
+                toggleFullscreen();
+                break;
+            case 'Escape':
+                if (document.fullscreenElement) {
+                    document.exitFullscreen();
+                }
+                break;
+        }
+    }
+});
@@ -0,0 +1,201 @@
+// Form submission handling
+document.getElementById('uploadForm').addEventListener('submit', async function(e) {
+    e.preventDefault();
+
+    const formData = new FormData();
+    const fileInput = document.getElementById('invoice_file');
+    const file = fileInput.files[0];
+
+    if (!file) {
+        showAlert('Please select a file to upload', 'warning');
+        return;
+    }
+
+    formData.append('invoice_file', file);
+
+    // Show loading
+    showLoading(true);
+    hideResults();
+    clearAlerts();
+
+    try {
+        console.log('Starting upload request...');
+        console.log('File:', file.name, file.type, file.size);
+
+        const response = await fetch('/upload', {
+            method: 'POST',
+            body: formData
+        });
+
+        console.log('Response received:', response.status, response.statusText);
+
+        const result = await response.json();
+        console.log('Response data:', result);
+
+        if (result.success) {
+            displayResults(result.data, result.image_url, result.thumbnail_url);
+            showAlert('Invoice data extracted successfully!', 'success');
+        } else {
+            showAlert(`Error: ${result.error}`, 'danger');
+        }
+    } catch (error) {
+        console.error('Upload error:', error);
+        console.error('Error details:', error.message, error.stack);
+        showAlert(`Network error: ${error.message}`, 'danger');
+    } finally {
+        showLoading(false);
+    }
+});
+
+function showLoading(show) {
+    const loading = document.getElementById('loadingIndicator');
+    const btn = document.getElementById('extractBtn');
+
+    if (show) {
+        loading.classList.remove('d-none');
+        btn.disabled = true;
+        btn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Processing...';
+    } else {
+        loading.classList.add('d-none');
+        btn.disabled = false;
+        btn.innerHTML = '<i class="fas fa-magic me-2"></i>Extract Invoice Data';
+    }
+}
+
+function showAlert(message, type) {
+    const container = document.getElementById('alertContainer');
+    const alert = document.createElement('div');
+    alert.className = `alert alert-${type} alert-dismissible fade show`;
+    alert.innerHTML = `
+        ${message}
+        <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+    `;
+    container.appendChild(alert);
+}
+
+function clearAlerts() {
+    document.getElementById('alertContainer').innerHTML = '';
+}
+
+function displayResults(data, imageUrl, thumbnailUrl) {
+    // Show invoice preview (small thumbnail; zoom/download use the original)
+    if (imageUrl) {
+        const invoicePreview = document.getElementById('invoicePreview');
+        invoicePreview.dataset.fullSrc = imageUrl;
+        invoicePreview.src = thumbnailUrl || imageUrl;
+        invoicePreview.style.display = 'block';
+    }
+
+    // Show results section
+    document.getElementById('resultsSection').classList.remove('d-none');
+
+    // Display JSON data
+    // Pretty-printed client-side; the server no longer sends a second formatted copy
+    document.getElementById('jsonResult').textContent = JSON.stringify(data, null, 2);
+
+    // Create summary cards
+    createSummaryCards(data);
+
+    // Scroll to results
+    document.getElementById('resultsSection').scrollIntoView({ behavior: 'smooth' });
+}
+
+function createSummaryCards(data) {
+    const container = document.getElementById('summaryCards');
+    container.innerHTML = '';
+
+    // Define key fields to highlight
+    const keyFields = [
+        { key: 'invoice_number', label: 'Invoice #', icon: 'fas fa-hashtag' },
+        { key: 'total_amount', label: 'Total Amount', icon: 'fas fa-dollar-sign' },
+        { key: 'invoice_date', label: 'Date', icon: 'fas fa-calendar' },
+        { key: 'due_date', label: 'Due Date', icon: 'fas fa-clock' }
+    ];
+
+    keyFields.forEach(field => {
+        let value = data[field.key];
+        if (value !== undefined && value !== null) {
+            if (field.key.includes('amount') && typeof value === 'number') {
+                value = `$${value.toFixed(2)}`;
+            }
+
+            const card = document.createElement('div');
+            card.className = 'col-md-3 col-sm-6 mb-3';
+            card.innerHTML = `
+                <div class="card bg-light">
+                    <div class="card-body text-center">
+                        <i class="${field.icon} fa-2x text-primary mb-2"></i>
+                        <h6 class="card-title">${field.label}</h6>
+                        <p class="card-text fw-bold">${value}</p>
+                    </div>
+                </div>
+            `;
+            container.appendChild(card);
+        }
+    });
+
+    // Add vendor info if available
+    if (data.vendor && data.vendor.name) {
+        const card = document.createElement('div');
+        card.className = 'col-md-3 col-sm-6 mb-3';
+        card.innerHTML = `
+            <div class="card bg-light">
+                <div class="card-body text-center">
+                    <i class="fas fa-building fa-2x text-primary mb-2"></i>
+                    <h6 class="card-title">Vendor</h6>
+                    <p class="card-text fw-bold">${data.vendor.name}</p>
+                </div>
+            </div>
+        `;
+        container.appendChild(card);
+    }
+}
+
+function hideResults() {
+    document.getElementById('resultsSection').classList.add('d-none');
+}
+
+function resetForm() {
+    document.getElementById('uploadForm').reset();
+    hideResults();
+    clearAlerts();
+}
+
+function copyToClipboard() {
+    const text = document.getElementById('jsonResult').textContent;
+    navigator.clipboard.writeText(text).then(() => {
+        const btn = document.getElementById('copyBtn');
+        const originalText = btn.innerHTML;
+        btn.innerHTML = '<i class="fas fa-check me-1"></i>Copied!';
+        btn.classList.add('btn-success');
+        btn.classList.remove('btn-outline-secondary');
+
+        setTimeout(() => {
+            btn.innerHTML = originalText;
+            btn.classList.remove('btn-success');
+            btn.classList.add('btn-outline-secondary');
+        }, 2000);
+    });
+}
+
+// Test function for debugging fetch issues
+async function testFetch() {
+    console.log('Testing fetch connection...');
+    try {
+        const response = await fetch('/test', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({test: 'data'})
+        });
+
+        console.log('Test response:', response.status, response.statusText);
+        const result = await response.json();
+        console.log('Test result:', result);
+        showAlert('✅ Connection test successful!', 'success');
+    } catch (error) {
+        console.error('Test error:', error);
+        showAlert(`❌ Connection test failed: ${error.message}`, 'danger');
+    }
+}
@@ -0,0 +1,197 @@
+// Image zoom functionality
+let currentZoom = 1;
+const zoomStep = 0.2;
+const minZoom = 0.5;
+const maxZoom = 3;
+
+// Main screen zoom functionality
+let mainCurrentZoom = 1;
+const mainZoomStep = 0.2;
+const mainMinZoom = 0.5;
+const mainMaxZoom = 2;
+
+function mainZoomIn() {
+    if (mainCurrentZoom < mainMaxZoom) {
+        mainCurrentZoom = Math.min(mainCurrentZoom + mainZoomStep, mainMaxZoom);
+        applyMainZoom();
+    }
+}
+
+function mainZoomOut() {
+    if (mainCurrentZoom > mainMinZoom) {
+        mainCurrentZoom = Math.max(mainCurrentZoom - mainZoomStep, mainMinZoom);
+        applyMainZoom();
+    }
+}
+
+function mainResetZoom() {
+    mainCurrentZoom = 1;
+    applyMainZoom();
+}
+
+function applyMainZoom() {
+    const invoicePreview = document.getElementById('invoicePreview');
+    const mainZoomLevel = document.getElementById('mainZoomLevel');
+    const demoZoomLevel = document.getElementById('demoZoomLevel');
+
+    if (invoicePreview) {
+        invoicePreview.style.transform = `scale(${mainCurrentZoom})`;
+        invoicePreview.style.transformOrigin = 'center';
+        if (mainZoomLevel) mainZoomLevel.textContent = `${Math.round(mainCurrentZoom * 100)}%`;
+    }
+
+    // Update demo zoom level indicator
+    if (demoZoomLevel) {
+        demoZoomLevel.textContent = `${Math.round(mainCurrentZoom * 100)}%`;
+    }
+}
+
+// Demo zoom functions (same as main zoom but with visual feedback)
+function demoZoomIn() {
+    mainZoomIn();
+    showZoomFeedback('Zoom In');
+}
+
+function demoZoomOut() {
+    mainZoomOut();
+    showZoomFeedback('Zoom Out');
+}
+
+function demoResetZoom() {
+    mainResetZoom();
+    showZoomFeedback('Reset Zoom');
+}
+
+function showZoomFeedback(action) {
+    // Show a brief message about zoom action
+    const alertContainer = document.getElementById('alertContainer');
+    if (alertContainer) {
+        const alert = document.createElement('div');
+        alert.className = 'alert alert-info alert-dismissible fade show';
+        alert.innerHTML = `
+            <i class="fas fa-search me-2"></i>
+            ${action} ${mainCurrentZoom > 1 ? 'activated' : mainCurrentZoom < 1 ? 'activated' : 'to 100%'}
+            ${!document.getElementById('invoicePreview').src ? ' (Upload an invoice to see the effect)' : ''}
+            <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+        `;
+        alertContainer.appendChild(alert);
+
+        // Auto dismiss after 3 seconds
+        setTimeout(() => {
+            if (alert.parentNode) {
+                alert.remove();
+            }
+        }, 3000);
+    }
+}
+
+function openImageZoom() {
+    const invoicePreview = document.getElementById('invoicePreview');
+    const zoomedImage = document.getElementById('zoomedImage');
+    const modalFileName = document.getElementById('modalFileName');
+
+    if (invoicePreview.src) {
+        zoomedImage.src = invoicePreview.dataset.fullSrc || invoicePreview.src;
+        modalFileName.textContent = invoicePreview.alt || 'invoice.jpg';
+        resetZoom();
+
+        const modal = new bootstrap.Modal(document.getElementById('imageZoomModal'));
+        modal.show();
+    }
+}
+
+function zoomIn() {
+    if (currentZoom < maxZoom) {
+        currentZoom = Math.min(currentZoom + zoomStep, maxZoom);
+        applyZoom();
+    }
+}
+
+function zoomOut() {
+    if (currentZoom > minZoom) {
+        currentZoom = Math.max(currentZoom - zoomStep, minZoom);
+        applyZoom();
+    }
+}
+
+function resetZoom() {
+    currentZoom = 1;
+    applyZoom();
+}
+
+function applyZoom() {
+    const zoomedImage = document.getElementById('zoomedImage');
+    const zoomLevel = document.getElementById('zoomLevel');
+
+    zoomedImage.style.transform = `scale(${currentZoom})`;
+    zoomLevel.textContent = `${Math.round(currentZoom * 100)}%`;
+}
+
+function toggleFullscreen() {
+    const modal = document.getElementById('imageZoomModal');
+
+    if (!document.fullscreenElement) {
+        modal.requestFullscreen().catch(err => {
+            console.log(`Error attempting to enable fullscreen: ${err.message}`);
+        });
+    } else {
+        document.exitFullscreen();
+    }
+}
+
+function downloadImage() {
+    const invoicePreview = document.getElementById('invoicePreview');
+
+    if (invoicePreview.src) {
+        const link = document.createElement('a');
+        link.href = invoicePreview.dataset.fullSrc || invoicePreview.src;
+        link.download = 'invoice.jpg';
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+    }
+}
+
+// Mouse wheel zoom in modal
+document.getElementById('imageZoomModal').addEventListener('wheel', function(e) {
+    if (e.ctrlKey) {
+        e.preventDefault();
+        if (e.deltaY < 0) {
+            zoomIn();
+        } else {
+            zoomOut();
+        }
+    }
+});
+
+// Keyboard shortcuts for zoom
+document.addEventListener('keydown', function(e) {
+    const modal = document.getElementById('imageZoomModal');
+    if (modal.classList.contains('show')) {
+        switch(e.key) {
+            case '+':
+            case '=':
+                e.preventDefault();
+                zoomIn();
+                break;
+            case '-':
+                e.preventDefault();
+                zoomOut();
+                break;
+            case '0':
+                e.preventDefault();
+                resetZoom();
+                break;
+            case 'f':
+            case 'F':
+                e.preventDefault();
+                toggleFullscreen();
+                break;
+            case 'Escape':
+                if (document.fullscreenElement) {
+                    document.exitFullscreen();
+                }
+                break;
+        }
+    }
+});
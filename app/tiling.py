@@ -0,0 +1,285 @@
+"""
+Tiled parallel extraction for long invoices.
+
+A single extraction call has a fixed output budget, so invoices with hundreds
+of line items come back as truncated JSON. Tiled mode splits the image into
+overlapping horizontal bands, extracts the header fields from the first and
+last bands (totals sit at the bottom) and the line items of every band
+concurrently, then stitches the rows back together, dropping the duplicates
+produced by the overlaps. Wall-clock latency stays close to one call because
+the calls run side by side. The full-height image is never sent: Bedrock
+rejects images taller than 8000px and shrinks smaller ones until the long
+edge is 1568px, which leaves a long strip unreadable.
+"""
+import os
+import re
+import math
+import shutil
+import tempfile
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Tiling needs Pillow; without it extraction stays single-call
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+HEADER_INSTRUCTIONS = (
+    "\n\nIMPORTANT: This image is the {part} of a long invoice whose line items are extracted separately. "
+    "Extract every field that is visible EXCEPT the line items, use null for fields that are not visible, "
+    "and return \"line_items\": []."
+)
+
+# Taken from the bottom band when both header calls return them
+FOOTER_FIELDS = ('subtotal', 'tax_amount', 'tax_rate', 'total_amount', 'amount_due', 'balance_due')
+
+# Largest edge Bedrock accepts for an image block
+MAX_IMAGE_EDGE = 8000
+
+# Lossless sources stay PNG; scans and photos are re-encoded as JPEG to keep payloads small
+LOSSLESS_FORMATS = ('PNG', 'GIF', 'BMP')
+
+TILE_PROMPT = """This image is horizontal slice {index} of {count} of a long invoice (slices overlap slightly).
+Extract only the line-item rows in this slice. Skip any row that is cut off at the top or bottom edge,
+and skip headers, subtotals and totals.
+
+Respond with a JSON object of the form:
+{{"line_items": [{{"description": "...", "quantity": 1, "unit_price": 0.00, "line_total": 0.00}}]}}
+
+Use numbers for amounts and null for values that are not visible, and keep the rows in top-to-bottom order.
+Please provide only the JSON response without any additional text or formatting."""
+
+LINE_ITEM_KEYS = ('line_items', 'items')
+
+def tiling_settings() -> Dict[str, Any]:
+    """Read tiled-mode settings from the environment."""
+    return {
+        'enabled': Image is not None and os.environ.get('TILING_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+        'min_aspect_ratio': float(os.environ.get('TILING_MIN_ASPECT_RATIO', '2.0')),
+        'tile_aspect_ratio': float(os.environ.get('TILING_TILE_ASPECT_RATIO', '1.0')),
+        'overlap': float(os.environ.get('TILING_OVERLAP', '0.15')),
+        'max_tiles': int(os.environ.get('TILING_MAX_TILES', '12')),
+        # Both header calls + every tile at once, so latency stays close to a single call
+        'max_workers': int(os.environ.get('TILING_MAX_WORKERS', '14'))
+    }
+
+def is_long_invoice(image_path: str, settings: Optional[Dict[str, Any]] = None) -> bool:
+    """Return True if the image is tall enough to warrant tiled extraction."""
+    settings = settings or tiling_settings()
+    if not settings['enabled']:
+        return False
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+    except Exception as e:
+        logger.warning(f"Could not read image size for {image_path}: {str(e)}")
+        return False
+    return width > 0 and height / width >= settings['min_aspect_ratio']
+
+def plan_tiles(width: int, height: int, settings: Dict[str, Any]) -> List[Tuple[int, int]]:
+    """
+    Compute overlapping vertical bands covering the image.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        settings: Tiling settings
+
+    Returns:
+        List of (top, bottom) pixel rows, one per tile
+    """
+    tile_height = max(1, int(width * settings['tile_aspect_ratio']))
+    if tile_height >= height:
+        return [(0, height)]
+
+    overlap = settings['overlap']
+    count = math.ceil((height - tile_height * overlap) / (tile_height * (1 - overlap)))
+    if count > settings['max_tiles']:
+        # Grow the tiles rather than exceed the concurrency budget:
+        # height = count * tile_height - (count - 1) * tile_height * overlap
+        count = settings['max_tiles']
+        tile_height = math.ceil(height / (count - (count - 1) * overlap))
+    if count <= 1:
+        return [(0, height)]
+
+    step = (height - tile_height) / (count - 1)
+    return [(int(round(i * step)), min(height, int(round(i * step)) + tile_height)) for i in range(count)]
+
+def _row_key(row: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Normalized identity of a line item, tolerant of formatting differences."""
+    description = re.sub(r'\s+', ' ', str(row.get('description') or '')).strip().lower()
+    total = row.get('line_total', row.get('total', row.get('amount')))
+
+    def number(value):
+        try:
+            return round(float(value), 2)
+        except (TypeError, ValueError):
+            return value
+
+    return (description, number(row.get('quantity')), number(total))
+
+def stitch_line_items(tiles: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Concatenate per-tile rows, removing duplicates at tile boundaries.
+
+    A row inside an overlap is seen by both neighbouring tiles, so for each
+    boundary the longest run of rows that ends the previous tile and starts
+    the next one is kept once. Identical rows elsewhere are left alone.
+
+    Args:
+        tiles: Line items of each tile, top to bottom
+
+    Returns:
+        Stitched line items
+    """
+    stitched: List[Dict[str, Any]] = []
+    previous: List[Tuple[Any, ...]] = []
+    for rows in tiles:
+        keys = [_row_key(row) for row in rows]
+        overlap = 0
+        for size in range(min(len(previous), len(keys)), 0, -1):
+            if previous[-size:] == keys[:size]:
+                overlap = size
+                break
+        stitched.extend(rows[overlap:])
+        previous = keys
+    return stitched
+
+def _save_tile(tile, tile_dir: str, index: int, source_format: Optional[str]) -> str:
+    """Write a tile in a format close to the source, within Bedrock's size limits."""
+    if max(tile.size) > MAX_IMAGE_EDGE:
+        tile.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE))
+    if tile.mode not in ('RGB', 'L'):
+        tile = tile.convert('RGB')
+    if source_format in LOSSLESS_FORMATS:
+        tile_path = os.path.join(tile_dir, f'tile_{index:03d}.png')
+        tile.save(tile_path, 'PNG')
+    else:
+        tile_path = os.path.join(tile_dir, f'tile_{index:03d}.jpg')
+        tile.save(tile_path, 'JPEG', quality=90)
+    return tile_path
+
+def merge_header(top: Dict[str, Any], bottom: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combine the header fields read from the first and last bands.
+
+    Fields come from the top band unless it had no value for them; totals
+    prefer the bottom band, where they are printed.
+
+    Args:
+        top: Extraction of the first band
+        bottom: Extraction of the last band
+
+    Returns:
+        Merged header fields
+    """
+    merged = dict(top)
+    from_bottom = set()
+    for key, value in bottom.items():
+        if value is None or key == 'field_confidence':
+            continue
+        if key in FOOTER_FIELDS or merged.get(key) is None:
+            merged[key] = value
+            from_bottom.add(key)
+
+    confidence = {}
+    for source, keys in ((top, set(top) - from_bottom), (bottom, from_bottom)):
+        for key, meta in (source.get('field_confidence') or {}).items():
+            if key in keys:
+                confidence[key] = meta
+    merged['field_confidence'] = confidence
+    return merged
+
+def _without_bboxes(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop field bboxes: they are relative to a band, not the full image."""
+    confidence = data.get('field_confidence')
+    if isinstance(confidence, dict):
+        data['field_confidence'] = {
+            key: {k: v for k, v in meta.items() if k != 'bbox'} if isinstance(meta, dict) else meta
+            for key, meta in confidence.items()
+        }
+    return data
+
+def _line_items(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    for key in LINE_ITEM_KEYS:
+        if isinstance(data.get(key), list):
+            return [row for row in data[key] if isinstance(row, dict)]
+    return []
+
+def extract_invoice_tiled(client, image_path: str, prompt: str) -> Dict[str, Any]:
+    """
+    Extract a long invoice with header calls on the first and last tiles plus
+    one line-item call per tile, all in parallel.
+
+    Args:
+        client: BedrockClient (or compatible mock/replay client)
+        image_path: Path to the invoice image
+        prompt: Extraction prompt
+
+    Returns:
+        Dictionary containing the header fields and stitched line_items
+    """
+    settings = tiling_settings()
+    tile_dir = tempfile.mkdtemp(prefix='invoice_tiles_')
+    try:
+        with Image.open(image_path) as img:
+            width, height = img.size
+            bands = plan_tiles(width, height, settings)
+            tile_paths = [
+                _save_tile(img.crop((0, top, width, bottom)), tile_dir, index, img.format)
+                for index, (top, bottom) in enumerate(bands)
+            ]
+
+        logger.info(f"🧩 Tiled extraction: {len(tile_paths)} tiles for {width}x{height} image")
+
+        calls = [
+            (tile_paths[0], prompt + HEADER_INSTRUCTIONS.format(part='top slice')),
+            (tile_paths[-1], prompt + HEADER_INSTRUCTIONS.format(part='bottom slice'))
+        ]
+        calls += [(path, TILE_PROMPT.format(index=i + 1, count=len(tile_paths))) for i, path in enumerate(tile_paths)]
+
+        # Each call runs in a copy of this context so usage accounting keeps its scope
+        with ThreadPoolExecutor(max_workers=max(1, min(settings['max_workers'], len(calls)))) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, client.extract_invoice_data, path, call_prompt)
+                for path, call_prompt in calls
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        shutil.rmtree(tile_dir, ignore_errors=True)
+
+    top, bottom, tile_results = results[0], results[1], results[2:]
+    headers = [result for result in (top, bottom) if result.get('extraction_successful', True)]
+    if len(headers) == 2:
+        header = merge_header(top, bottom)
+    elif headers:
+        logger.warning("⚠️ One header extraction failed, using the other band's fields")
+        header = headers[0]
+    else:
+        # Keep the line items even without header fields
+        logger.warning(f"⚠️ Header extraction failed: {top.get('error', 'Unknown error')}")
+        header = top
+
+    failed_tiles = [i + 1 for i, result in enumerate(tile_results) if not result.get('extraction_successful', True)]
+    if failed_tiles:
+        logger.warning(f"⚠️ Line items missing from tiles: {failed_tiles}")
+
+    data = _without_bboxes({key: value for key, value in header.items() if key not in LINE_ITEM_KEYS})
+    data['line_items'] = stitch_line_items([_line_items(result) for result in tile_results])
+    data['tiles'] = len(tile_results)
+    if failed_tiles:
+        data['failed_tiles'] = failed_tiles
+
+    token_usage = {'input_tokens': 0, 'output_tokens': 0}
+    for result in results:
+        usage = result.get('token_usage') or {}
+        token_usage['input_tokens'] += usage.get('input_tokens', 0)
+        token_usage['output_tokens'] += usage.get('output_tokens', 0)
+    data['token_usage'] = token_usage
+
+    logger.info(f"✅ Tiled extraction stitched {len(data['line_items'])} line items")
+    return data
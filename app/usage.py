@@ -0,0 +1,266 @@
+"""
+Token and cost accounting for Bedrock calls.
+
+BedrockClient.invoke_model() reports the ``usage`` block of every response to
+the process-wide UsageTracker. The call is attributed to whatever session and
+invoice are active in the current usage_scope(), and totals are kept per
+session, per invoice, per day and globally in the shared state store, so all
+worker processes see the same numbers and budgets. Session and invoice totals
+expire after a retention period so the table does not grow with all history.
+Invoice ids are opaque ids, never blob names: the report is unauthenticated
+and blob names are the URLs of the uploaded images.
+"""
+import os
+import time
+import contextvars
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+USAGE_NAMESPACE = 'usage'
+PURGE_INTERVAL_SECONDS = 600
+METRICS = ('calls', 'input_tokens', 'output_tokens', 'cost_usd')
+
+_current_scope: contextvars.ContextVar = contextvars.ContextVar('usage_scope', default={})
+_tracker = None
+
+class BudgetExceeded(Exception):
+    """Raised when a call would exceed a configured budget in reject mode."""
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@contextmanager
+def usage_scope(**attributes):
+    """
+    Attribute Bedrock calls made inside the block to a session and/or invoice.
+
+    Example:
+        with usage_scope(session_id=sid, invoice_id=upload_id):
+            client.extract_invoice_data(path, prompt)
+    """
+    token = _current_scope.set({**_current_scope.get(), **attributes})
+    try:
+        yield
+    finally:
+        _current_scope.reset(token)
+
+def set_usage_tracker(tracker) -> None:
+    """Install the process-wide tracker used by record_usage()."""
+    global _tracker
+    _tracker = tracker
+
+def get_usage_tracker():
+    """Return the process-wide tracker, if one is installed."""
+    return _tracker
+
+def record_usage(kind: str, usage: Optional[Dict[str, Any]]) -> None:
+    """Record a response's usage block against the current scope (no-op without a tracker)."""
+    if _tracker is None or not usage:
+        return
+    try:
+        _tracker.record(kind, usage, **_current_scope.get())
+    except Exception as e:
+        # Accounting must never break an extraction or chat turn
+        logger.error(f"Error recording token usage: {str(e)}")
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+class UsageTracker:
+    def __init__(self, state_store, input_price_per_mtok: float = 3.0, output_price_per_mtok: float = 15.0,
+                 session_token_budget: Optional[int] = None, daily_token_budget: Optional[int] = None,
+                 daily_cost_budget: Optional[float] = None, mode: str = 'reject', throttle_seconds: float = 5.0,
+                 session_retention_seconds: float = 86400, invoice_retention_seconds: float = 30 * 86400):
+        """
+        Initialize the usage tracker.
+
+        Args:
+            state_store: Shared StateStore holding the counters
+            input_price_per_mtok: USD per million input tokens
+            output_price_per_mtok: USD per million output tokens
+            session_token_budget: Max tokens (input + output) per session
+            daily_token_budget: Max tokens per UTC day across all sessions
+            daily_cost_budget: Max USD per UTC day across all sessions
+            mode: 'reject' to refuse calls over budget, 'throttle' to delay them
+            throttle_seconds: Delay applied per call in throttle mode
+            session_retention_seconds: How long per-session totals live after their last call
+            invoice_retention_seconds: How long per-invoice totals live after their last call
+        """
+        self.state_store = state_store
+        self.input_price_per_mtok = input_price_per_mtok
+        self.output_price_per_mtok = output_price_per_mtok
+        self.session_token_budget = session_token_budget
+        self.daily_token_budget = daily_token_budget
+        self.daily_cost_budget = daily_cost_budget
+        self.mode = mode
+        self.throttle_seconds = throttle_seconds
+        self.session_retention_seconds = session_retention_seconds
+        self.invoice_retention_seconds = invoice_retention_seconds
+        self._last_purge = 0.0
+
+    @classmethod
+    def from_env(cls, state_store) -> 'UsageTracker':
+        """Build a tracker from PRICE_* and BUDGET_* environment variables."""
+        def optional(name, cast):
+            value = os.environ.get(name)
+            return cast(value) if value else None
+
+        return cls(
+            state_store,
+            input_price_per_mtok=float(os.environ.get('PRICE_INPUT_PER_MTOK', '3.0')),
+            output_price_per_mtok=float(os.environ.get('PRICE_OUTPUT_PER_MTOK', '15.0')),
+            session_token_budget=optional('BUDGET_SESSION_TOKENS', int),
+            daily_token_budget=optional('BUDGET_DAILY_TOKENS', int),
+            daily_cost_budget=optional('BUDGET_DAILY_COST_USD', float),
+            mode=os.environ.get('BUDGET_MODE', 'reject').lower(),
+            throttle_seconds=float(os.environ.get('BUDGET_THROTTLE_SECONDS', '5')),
+            session_retention_seconds=float(os.environ.get('USAGE_SESSION_RETENTION_HOURS', '24')) * 3600,
+            invoice_retention_seconds=float(os.environ.get('USAGE_INVOICE_RETENTION_DAYS', '30')) * 86400
+        )
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        """USD cost of a call."""
+        return (input_tokens * self.input_price_per_mtok + output_tokens * self.output_price_per_mtok) / 1_000_000
+
+    def record(self, kind: str, usage: Dict[str, Any], session_id: Optional[str] = None,
+               invoice_id: Optional[str] = None) -> None:
+        """
+        Add one call's tokens and cost to every aggregate it belongs to.
+
+        Args:
+            kind: Call type ('extraction', 'chat', ...)
+            usage: Bedrock ``usage`` block (input_tokens, output_tokens)
+            session_id: Session the call was made for
+            invoice_id: Opaque id of the invoice the call was about (upload id or batch record id)
+        """
+        input_tokens = int(usage.get('input_tokens', 0))
+        output_tokens = int(usage.get('output_tokens', 0))
+        values = {
+            'calls': 1,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'cost_usd': self.cost(input_tokens, output_tokens)
+        }
+
+        def amounts(*scopes):
+            return {f'{scope}|{metric}': value for scope in scopes for metric, value in values.items()}
+
+        self.state_store.increment_many(USAGE_NAMESPACE, amounts('global', f'day:{_today()}', f'kind:{kind}'))
+        if session_id:
+            self.state_store.increment_many(USAGE_NAMESPACE, amounts(f'session:{session_id}'),
+                                            ttl=self.session_retention_seconds)
+        if invoice_id:
+            self.state_store.increment_many(USAGE_NAMESPACE, amounts(f'invoice:{invoice_id}'),
+                                            ttl=self.invoice_retention_seconds)
+        self._purge_expired()
+        logger.info(f"💰 {kind}: {input_tokens} in / {output_tokens} out tokens (${values['cost_usd']:.4f})")
+
+    def _purge_expired(self) -> None:
+        """Delete expired session/invoice totals, at most once per PURGE_INTERVAL_SECONDS per process."""
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        removed = self.state_store.purge_expired(USAGE_NAMESPACE)
+        if removed:
+            logger.info(f"🧹 Purged {removed} expired usage rows")
+
+    def _grouped(self, prefix: str) -> Dict[str, Dict[str, float]]:
+        """Totals of every scope starting with prefix, keyed by the rest of the scope name."""
+        grouped: Dict[str, Dict[str, float]] = {}
+        for key, value in self.state_store.items(USAGE_NAMESPACE, prefix=prefix).items():
+            scope, _, metric = key.rpartition('|')
+            grouped.setdefault(scope[len(prefix):], {m: 0 for m in METRICS})[metric] = value
+        return grouped
+
+    def totals(self, scope: str) -> Dict[str, float]:
+        """Return the aggregated metrics for one scope (e.g. 'global', 'session:<id>')."""
+        stored = self.state_store.items(USAGE_NAMESPACE, prefix=f'{scope}|')
+        totals = {metric: stored.get(f'{scope}|{metric}', 0) for metric in METRICS}
+        totals['cost_usd'] = round(totals['cost_usd'], 6)
+        return totals
+
+    def check_budget(self, session_id: Optional[str] = None) -> None:
+        """
+        Enforce the configured budgets before making a call.
+
+        In throttle mode an over-budget call is delayed instead of refused.
+
+        Args:
+            session_id: Session about to make the call
+
+        Raises:
+            BudgetExceeded: If a budget is exhausted and mode is 'reject'
+        """
+        reason = None
+        retry_after = None
+        if self.daily_token_budget or self.daily_cost_budget:
+            today = self.totals(f'day:{_today()}')
+            now = datetime.now(timezone.utc)
+            seconds_left_today = 86400 - (now.hour * 3600 + now.minute * 60 + now.second)
+            if self.daily_token_budget and today['input_tokens'] + today['output_tokens'] >= self.daily_token_budget:
+                reason, retry_after = 'Daily token budget exhausted', seconds_left_today
+            elif self.daily_cost_budget and today['cost_usd'] >= self.daily_cost_budget:
+                reason, retry_after = 'Daily cost budget exhausted', seconds_left_today
+        if reason is None and self.session_token_budget and session_id:
+            session_totals = self.totals(f'session:{session_id}')
+            if session_totals['input_tokens'] + session_totals['output_tokens'] >= self.session_token_budget:
+                reason = 'Session token budget exhausted'
+
+        if reason is None:
+            return
+        if self.mode == 'throttle':
+            logger.warning(f"⏳ {reason}; throttling call by {self.throttle_seconds}s")
+            time.sleep(self.throttle_seconds)
+            return
+        logger.warning(f"⛔ {reason}; rejecting call")
+        raise BudgetExceeded(reason, retry_after)
+
+    def report(self, session_id: Optional[str] = None, days: int = 7, top: int = 10) -> Dict[str, Any]:
+        """
+        Build the usage report served by /usage.
+
+        Args:
+            session_id: Include this session's totals
+            days: Number of most recent days to include
+            top: Number of most expensive invoices to list
+
+        Returns:
+            Dictionary of totals, daily breakdown, per-kind totals and top invoices
+        """
+        # Read only the scopes shown, not the whole namespace
+        today = datetime.now(timezone.utc).date()
+        recent_days = [(today - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(days)]
+        daily = {}
+        for day in recent_days:
+            totals = self.totals(f'day:{day}')
+            if totals['calls']:
+                daily[day] = totals
+        invoices = self._grouped('invoice:')
+        report = {
+            'global': self.totals('global'),
+            'daily': daily,
+            'by_kind': self._grouped('kind:'),
+            'top_invoices': [
+                {'invoice_id': invoice_id, **totals}
+                for invoice_id, totals in sorted(invoices.items(), key=lambda item: item[1]['cost_usd'], reverse=True)[:top]
+            ],
+            'pricing': {
+                'input_per_mtok': self.input_price_per_mtok,
+                'output_per_mtok': self.output_price_per_mtok
+            },
+            'budgets': {
+                'session_tokens': self.session_token_budget,
+                'daily_tokens': self.daily_token_budget,
+                'daily_cost_usd': self.daily_cost_budget,
+                'mode': self.mode
+            }
+        }
+        if session_id:
+            report['session'] = self.totals(f'session:{session_id}')
+        return report
@@ -0,0 +1,243 @@
+"""
+Bulk invoice extraction from the command line.
+
+Walks a directory tree, extracts every invoice image concurrently and appends
+one JSON line per invoice to the output file. The output doubles as the
+checkpoint: files already in it are skipped, so an interrupted or crashed run
+picks up where it stopped. Failed files go to <output>.errors.jsonl and are
+retried on the next run.
+
+Usage:
+    python bulk_extract.py /path/to/scans results.jsonl --workers 16
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterator, List, Set
+
+from app.bedrock_client import BedrockClient
+from app.extraction import extract_invoice
+from app.mock_bedrock import MockBedrockClient
+from app.utils import allowed_file, load_prompt_template
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROMPT_FILE = os.path.join(os.path.dirname(__file__), 'app', 'prompts', 'invoice_prompt.txt')
+
+def find_invoices(root: str) -> List[str]:
+    """Return the invoice images under root as sorted paths relative to it."""
+    found = []
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in filenames:
+            if allowed_file(filename):
+                found.append(os.path.relpath(os.path.join(directory, filename), root))
+    return sorted(found)
+
+def load_checkpoint(output_path: str) -> Set[str]:
+    """
+    Read the files already extracted into the output file.
+
+    A line cut off by a crash is removed so appending can resume cleanly.
+
+    Args:
+        output_path: JSONL results file
+
+    Returns:
+        Relative paths of completed files
+    """
+    completed: Set[str] = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    valid_bytes = 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)['file'])
+            except (ValueError, KeyError):
+                break
+            valid_bytes += len(line)
+
+    if valid_bytes < os.path.getsize(output_path):
+        logger.warning(f"⚠️ Dropping incomplete trailing record from {output_path}")
+        with open(output_path, 'r+b') as f:
+            f.truncate(valid_bytes)
+    return completed
+
+def extract_one(client, root: str, relative_path: str, prompt: str) -> Dict[str, Any]:
+    """Extract a single invoice and build its output record."""
+    started = time.time()
+    data = extract_invoice(client, os.path.join(root, relative_path), prompt)
+    return {
+        'file': relative_path,
+        'extraction': data,
+        'latency_seconds': round(time.time() - started, 3),
+        'extracted_at': time.time()
+    }
+
+class Progress:
+    def __init__(self, total: int, stream=sys.stderr, interval: float = 0.5):
+        """
+        Live throughput/ETA line.
+
+        Args:
+            total: Files to process in this run
+            stream: Where the progress line is written
+            interval: Minimum seconds between redraws
+        """
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.stream = stream
+        self.interval = interval
+        self.started = time.time()
+        self._last_draw = 0.0
+
+    def update(self, failed: bool = False) -> None:
+        """Count one finished file and redraw if due."""
+        self.done += 1
+        if failed:
+            self.failed += 1
+        if time.time() - self._last_draw >= self.interval or self.done == self.total:
+            self.draw()
+
+    def draw(self) -> None:
+        now = time.time()
+        self._last_draw = now
+        rate = self.done / max(now - self.started, 1e-6)
+        eta = time.strftime('%H:%M:%S', time.gmtime((self.total - self.done) / rate)) if rate else '--:--:--'
+        self.stream.write(
+            f"\r📦 {self.done}/{self.total} ({self.failed} failed) | "
+            f"{rate:.2f} files/s | {rate * 3600:.0f} files/h | ETA {eta}   "
+        )
+        self.stream.flush()
+
+def run(root: str, output_path: str, client, prompt: str, workers: int = 8, limit: int = None) -> Dict[str, int]:
+    """
+    Extract every pending invoice under root into output_path.
+
+    Args:
+        root: Directory tree holding the invoices
+        output_path: JSONL results file (also the checkpoint)
+        client: BedrockClient (or compatible mock/replay client)
+        prompt: Extraction prompt
+        workers: Maximum concurrent extractions
+        limit: Process at most this many pending files
+
+    Returns:
+        Counts of completed, failed, skipped and remaining files
+    """
+    completed = load_checkpoint(output_path)
+    invoices = find_invoices(root)
+    pending = [path for path in invoices if path not in completed]
+    skipped = len(invoices) - len(pending)
+    if limit is not None:
+        pending = pending[:limit]
+    print(f"🗂️ {len(invoices)} invoices found, {skipped} already extracted, {len(pending)} to go", file=sys.stderr)
+
+    errors_path = output_path + '.errors.jsonl'
+    progress = Progress(len(pending))
+    queue: Iterator[str] = iter(pending)
+    succeeded = failed = 0
+    interrupted = False
+
+    with open(output_path, 'a', encoding='utf-8') as output, \
+            open(errors_path, 'a', encoding='utf-8') as errors, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+
+        def refill():
+            # Keep a bounded window so an interrupt leaves little work to drain
+            while len(in_flight) < workers * 2:
+                path = next(queue, None)
+                if path is None:
+                    return
+                in_flight[pool.submit(extract_one, client, root, path, prompt)] = path
+
+        refill()
+        while in_flight:
+            try:
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            except KeyboardInterrupt:
+                interrupted = True
+                logger.warning("\n🛑 Interrupted, finishing in-flight files")
+                queue = iter(())
+                for future in list(in_flight):
+                    if future.cancel():
+                        del in_flight[future]
+                continue
+
+            for future in done:
+                path = in_flight.pop(future)
+                try:
+                    record = future.result()
+                    error = None if record['extraction'].get('extraction_successful', True) else \
+                        record['extraction'].get('error', 'Extraction failed')
+                except Exception as e:
+                    record, error = None, str(e)
+
+                if error is None:
+                    # One flushed line per file: the output is the checkpoint
+                    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    output.flush()
+                    succeeded += 1
+                else:
+                    errors.write(json.dumps({'file': path, 'error': error, 'failed_at': time.time()}) + '\n')
+                    errors.flush()
+                    failed += 1
+                progress.update(failed=error is not None)
+            refill()
+
+        if progress.total:
+            if progress.done < progress.total:
+                progress.draw()
+            sys.stderr.write('\n')
+
+    remaining = len(invoices) - skipped - succeeded
+    print(f"✅ {succeeded} extracted, {failed} failed, {remaining} remaining", file=sys.stderr)
+    return {
+        'completed': succeeded,
+        'failed': failed,
+        'skipped': skipped,
+        'remaining': remaining,
+        'interrupted': int(interrupted)
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Extract a directory tree of invoice images to JSONL.')
+    parser.add_argument('input_dir', help='Directory tree of invoice images')
+    parser.add_argument('output', help='JSONL results file; re-running resumes from it')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('BULK_WORKERS', '8')),
+                        help='Concurrent extractions (default: BULK_WORKERS or 8)')
+    parser.add_argument('--prompt', default=DEFAULT_PROMPT_FILE, help='Extraction prompt file')
+    parser.add_argument('--limit', type=int, help='Process at most this many pending files')
+    parser.add_argument('--mock', action='store_true', help='Use the mock Bedrock client instead of AWS')
+    parser.add_argument('--verbose', action='store_true', help='Log every extraction step (INFO) instead of warnings only')
+    args = parser.parse_args(argv)
+
+    # The app modules log several INFO lines per file, which would bury the live progress line
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"Not a directory: {args.input_dir}")
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # No silent fallback to the mock client: a bulk run against fake data would look like success
+    client = MockBedrockClient() if args.mock else BedrockClient()
+    prompt = load_prompt_template(args.prompt)
+
+    result = run(args.input_dir, args.output, client, prompt, workers=max(1, args.workers), limit=args.limit)
+    if result['interrupted']:
+        return 130
+    return 1 if result['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
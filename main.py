@@ -13,6 +13,7 @@ def ensure_directories():
     base_dir = os.path.dirname(__file__)
     directories = [
         os.path.join(base_dir, 'uploads'),
+        os.path.join(base_dir, 'data'),
         os.path.join(base_dir, 'app', 'static', 'uploads')
     ]
     
@@ -27,24 +28,35 @@ flask_app = create_app()
 # Convert Flask WSGI app to ASGI for Uvicorn
 app = WsgiToAsgi(flask_app)
 
+def get_worker_count() -> int:
+    """Number of worker processes, from WEB_CONCURRENCY (default 1)."""
+    try:
+        return max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+    except ValueError:
+        return 1
+
 if __name__ == "__main__":
     # Ensure required directories exist
     ensure_directories()
     
+    workers = get_worker_count()
+    
     # Run with Uvicorn
     print("🚀 Starting Invoice Extraction & Chatbot with Uvicorn...")
     print("📱 Access the app at: http://localhost:8000")
-    print("🔄 Hot reload enabled for development")
+    print(f"👷 Worker processes: {workers}")
     
     try:
         uvicorn.run(
-            app,  # Pass app directly instead of string reference
-            host="127.0.0.1",  # Use localhost instead of 0.0.0.0 for stability
-            port=8000,
+            # Multiple workers need an import string so each process builds its own app;
+            # session, invoice and cache state is shared through the SQLite state store
+            "main:app" if workers > 1 else app,
+            host=os.environ.get('HOST', '127.0.0.1'),
+            port=int(os.environ.get('PORT', '8000')),
             reload=False,  # Disable reload to prevent executor issues
             log_level="info",
             access_log=True,
-            workers=1  # Single worker to avoid threading issues
+            workers=workers
         )
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by user")